@@ -1,17 +1,20 @@
 import os
+import re
+import sys
+import json
+import time
+import argparse
 import subprocess
 import logging
 import tempfile
-import shutil
-import torchaudio
-import torch
-import math
+import threading
+import urllib.error
+import urllib.request
 import warnings
-from speechbrain.inference.ASR import EncoderDecoderASR
-from speechbrain.utils.text_to_sequence import text_to_sequence
-from speechbrain.utils.fetching import LocalStrategy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import numpy as np
-from huggingface_hub import login
+# torch, torchaudio, speechbrain and huggingface_hub are imported where they are used,
+# so the --submit client does not pay for loading them
 
 # Suppress torchaudio and huggingface_hub symlink warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="torchaudio._backend")
@@ -37,6 +40,20 @@ OUTPUT_FOLDER = r"output"
 # Ensure output directory exists
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# Alignment mode: "ctc" forced-aligns the transcript on the encoder's CTC posteriors (one encoder pass per
+# chunk, no beam search or language model); "even" spaces the words evenly over the audio
+ALIGNMENT_MODE = "ctc"
+
+# Streaming decode: audio is read from one FFmpeg pipe in overlapping windows, each encoded on its own
+SAMPLE_RATE = 16000
+STREAM_WINDOW_SECONDS = 30
+STREAM_OVERLAP_SECONDS = 2  # Posteriors are stitched at the middle of each overlap
+
+# Alignment service (--serve): the model stays loaded and jobs arrive over local HTTP
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_TIMEOUT_SECONDS = 3600
+
 # ASS header for subtitle file
 ASS_HEADER = """[Script Info]
 Title: Generated Captions
@@ -67,10 +84,9 @@ def format_ass_time(t: float) -> str:
 def clean_text(text: str) -> str:
     return ' '.join(text.strip().split())
 
-# Custom FFmpeg path escaping for Windows
-def escape_ffmpeg_path(path):
-    path = os.path.normpath(path)
-    return f'"{path}"'
+# Escape a path for use inside a single-quoted FFmpeg filter option
+def escape_filter_path(path):
+    return path.replace('\\', '\\\\').replace(':', '\\:').replace(',', '\\,')
 
 # Check if FFmpeg is installed
 def check_ffmpeg():
@@ -82,86 +98,137 @@ def check_ffmpeg():
         logger.error(f"FFmpeg check failed: {e}")
         return False
 
-# Split audio if duration exceeds chunk_duration (default 1800 seconds)
-def split_audio(audio_path, chunk_duration=1800):
-    try:
-        info = torchaudio.info(audio_path)
-        duration = info.num_frames / info.sample_rate
-        if duration <= chunk_duration:
-            return [audio_path]
-        logger.info(f"Audio duration {duration:.2f}s exceeds {chunk_duration}s, splitting...")
-        temp_dir = tempfile.mkdtemp()
-        chunk_paths = []
-        num_chunks = math.ceil(duration / chunk_duration)
-        cmd = [
-            "ffmpeg",
-            "-i", escape_ffmpeg_path(audio_path),
-            "-f", "segment",
-            "-segment_time", str(chunk_duration),
-            "-c", "copy",
-            os.path.join(temp_dir, "chunk_%03d.mp3")
-        ]
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-        chunk_paths = sorted([os.path.join(temp_dir, f) for f in os.listdir(temp_dir) if f.endswith(".mp3")])
-        logger.info(f"Split into {len(chunk_paths)} chunks: {chunk_paths}")
-        return chunk_paths
-    except Exception as e:
-        logger.error(f"Failed to split audio {audio_path}: {e}")
-        return [audio_path]
-
-# Load audio waveform
-def load_audio(audio_path):
-    try:
-        waveform, sample_rate = torchaudio.load(audio_path)
-        if sample_rate != 16000:
-            resampler = torchaudio.transforms.Resample(sample_rate, 16000)
-            waveform = resampler(waveform)
-        return waveform, 16000
-    except Exception as e:
-        logger.error(f"Failed to load audio {audio_path}: {e}")
-        return None, None
+# Stream a file's audio as overlapping 16 kHz mono windows decoded by a single FFmpeg process
+# Yields (offset in seconds, waveform [1, samples]); only one window is held in memory at a time
+def stream_audio_windows(audio_path, window_seconds=None, overlap_seconds=None):
+    import torch
+    window = int((window_seconds or STREAM_WINDOW_SECONDS) * SAMPLE_RATE)
+    hop = window - int((overlap_seconds if overlap_seconds is not None else STREAM_OVERLAP_SECONDS) * SAMPLE_RATE)
+    cmd = ["ffmpeg", "-v", "error", "-nostdin", "-i", audio_path, "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "f32le", "-"]
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            buffer = np.empty(0, dtype=np.float32)
+            offset = 0  # Samples before the start of the buffer
+            eof = False
+            while True:
+                while not eof and len(buffer) < window:
+                    block = process.stdout.read((window - len(buffer)) * 4)
+                    if not block:
+                        eof = True
+                        break
+                    buffer = np.concatenate((buffer, np.frombuffer(block[:len(block) // 4 * 4], dtype=np.float32)))
+                # Stop when what is left was already covered by the previous window's overlap
+                if len(buffer) == 0 or (offset > 0 and eof and len(buffer) <= window - hop):
+                    break
+                yield offset / SAMPLE_RATE, torch.from_numpy(buffer[:window].copy()).unsqueeze(0)
+                if eof and len(buffer) <= window:
+                    break
+                buffer = buffer[hop:]
+                offset += hop
+        except GeneratorExit:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            stderr_file.seek(0)
+            error = stderr_file.read().decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"FFmpeg exited with code {process.returncode}: {error}")
+
+# Keep the posterior frames of one window that start within [start_time, end_time)
+def trim_window(posteriors, offset, seconds_per_frame, start_time, end_time):
+    import torch
+    times = offset + torch.arange(posteriors.size(0)) * seconds_per_frame
+    return posteriors[(times >= start_time) & (times < end_time)]
+
+# Normalize a word to the LibriSpeech token alphabet (upper-case letters and apostrophes)
+def normalize_word(word):
+    return re.sub(r"[^A-Z']", "", word.upper())
+
+# Tokenize the transcript words for CTC alignment
+# Returns the posterior columns to keep (blank first), the targets as column indices and each token's word
+def prepare_ctc_targets(asr_model, words):
+    blank_index = getattr(asr_model.hparams, "blank_index", 0)
+    token_ids = []
+    token_words = []  # Index of the word each token belongs to
+    for i, word in enumerate(words):
+        normalized = normalize_word(word)
+        if not normalized:
+            continue
+        for token_id in asr_model.tokenizer.encode_as_ids(normalized):
+            if token_id != blank_index:  # Unknown pieces share the blank id
+                token_ids.append(token_id)
+                token_words.append(i)
+    if not token_ids:
+        raise ValueError("Transcript has no alignable tokens")
+    # Only the transcript's own tokens are kept from each window, which keeps long files small
+    columns = [blank_index] + sorted(set(token_ids))
+    column_of = {token_id: i for i, token_id in enumerate(columns)}
+    return columns, [column_of[token_id] for token_id in token_ids], token_words
+
+# Compute CTC log-posteriors for a waveform with a single encoder forward pass (no decoder or LM)
+def compute_ctc_posteriors(asr_model, waveform, columns):
+    import torch
+    ctc_lin = getattr(asr_model.hparams, "ctc_lin", None)
+    if ctc_lin is None:
+        raise RuntimeError("The loaded model has no CTC head (hparams.ctc_lin)")
+    with torch.no_grad():
+        encoder_out = asr_model.encode_batch(waveform, torch.tensor([1.0], device=waveform.device))
+        return torch.log_softmax(ctc_lin(encoder_out), dim=-1)[0][:, columns].cpu()
+
+# Forced-align the transcript words to CTC log-posteriors (blank in column 0) and return word timings
+def ctc_align_words(log_probs, targets, token_words, seconds_per_frame, words):
+    import torch
+    import torchaudio
+    labels, scores = torchaudio.functional.forced_align(
+        log_probs.unsqueeze(0), torch.tensor([targets], dtype=torch.int32), blank=0
+    )
+    spans = torchaudio.functional.merge_tokens(labels[0], scores[0].exp())
+    starts = {}
+    ends = {}
+    for span, word_index in zip(spans, token_words):
+        starts.setdefault(word_index, span.start * seconds_per_frame)
+        ends[word_index] = span.end * seconds_per_frame
+
+    # Words without tokens (numbers, symbols) fill the gap between their aligned neighbours
+    alignments = []
+    previous_end = 0.0
+    for i, word in enumerate(words):
+        if i in starts:
+            start_time, end_time = starts[i], ends[i]
+        else:
+            next_start = next((starts[j] for j in range(i + 1, len(words)) if j in starts), previous_end)
+            start_time, end_time = previous_end, max(next_start, previous_end)
+        alignments.append({'word': word, 'time_start': start_time, 'time_end': end_time})
+        previous_end = end_time
+    return alignments
+
+# Space words evenly across the audio duration
+def even_align_words(duration, words):
+    word_duration = duration / len(words)
+    return [
+        {'word': word, 'time_start': i * word_duration, 'time_end': (i + 1) * word_duration}
+        for i, word in enumerate(words)
+    ]
 
-# Perform forced alignment using SpeechBrain
-def align_transcript(asr_model, waveform, sample_rate, transcript):
-    try:
-        # Tokenize transcript
-        tokens = text_to_sequence(transcript, task="asr")
-        token_tensor = torch.tensor([tokens], device=waveform.device)
-        
-        # Get audio duration
-        duration = waveform.shape[1] / sample_rate
-        
-        # Perform transcription to get logits
-        logits, _ = asr_model.transcribe_batch(waveform, torch.tensor([1.0]))
-        
-        # Estimate word timings (simplified approach)
-        words = transcript.split()
-        num_words = len(words)
-        if num_words == 0:
-            return []
-        
-        # Approximate timing by dividing audio duration
-        word_duration = duration / num_words
-        alignments = []
-        for i, word in enumerate(words):
-            start_time = i * word_duration
-            end_time = (i + 1) * word_duration
-            alignments.append({
-                'word': word,
-                'time_start': start_time,
-                'time_end': end_time
-            })
-        return alignments
-    except Exception as e:
-        logger.error(f"Alignment failed: {e}")
+# Align the transcript: CTC forced alignment when posteriors are available, even spacing otherwise
+def align_transcript(log_probs, targets, token_words, duration, words):
+    if not words:
         return []
+    if log_probs is not None:
+        try:
+            return ctc_align_words(log_probs, targets, token_words, duration / log_probs.size(0), words)
+        except Exception as e:
+            logger.warning(f"CTC alignment failed, spacing words evenly: {e}")
+    return even_align_words(duration, words)
 
-# Main processing
-def main():
-    # Verify FFmpeg
-    if not check_ffmpeg():
-        logger.error("FFmpeg is not installed or not in PATH. Please install FFmpeg.")
-        return
+# Load the SpeechBrain model (heavy imports happen here, so the service client starts instantly)
+def load_asr_model():
+    from speechbrain.inference.ASR import EncoderDecoderASR
+    from speechbrain.utils.fetching import LocalStrategy
+    from huggingface_hub import login
 
     # Authenticate with Hugging Face (optional, set HF_TOKEN environment variable if needed)
     hf_token = os.getenv("HF_TOKEN")
@@ -180,8 +247,228 @@ def main():
             fetch_strategy=LocalStrategy.FETCH_LOCAL
         )
         logger.info("SpeechBrain ASR model loaded successfully.")
+        return asr_model
     except Exception as e:
         logger.error(f"Failed to load SpeechBrain model: {e}")
+        return None
+
+# Align a transcript to an audio file; returns the word timings (empty on failure)
+def align_file(asr_model, audio_path, transcript, base_name):
+    import torch
+
+    # Tokenize the transcript once for CTC alignment
+    words = transcript.split()
+    use_ctc = ALIGNMENT_MODE == "ctc"
+    columns = targets = token_words = None
+    if use_ctc:
+        try:
+            columns, targets, token_words = prepare_ctc_targets(asr_model, words)
+        except Exception as e:
+            logger.warning(f"Cannot tokenize transcript for {base_name}, spacing words evenly: {e}")
+            use_ctc = False
+
+    # Stream the audio in overlapping windows; each window's posteriors are trimmed at the middle
+    # of its overlaps once the next window's offset is known, then concatenated and aligned once
+    device = next(asr_model.parameters()).device
+    kept = []
+    pending = None  # (posteriors, offset, seconds_per_frame, start_time) awaiting the next window
+    duration = 0.0
+    try:
+        for offset, waveform in stream_audio_windows(audio_path):
+            duration = offset + waveform.shape[1] / SAMPLE_RATE
+            if not use_ctc:
+                continue
+            try:
+                posteriors = compute_ctc_posteriors(asr_model, waveform.to(device), columns)
+            except Exception as e:
+                logger.error(f"Encoding failed for {base_name} at {offset:.1f}s, spacing words evenly: {e}")
+                use_ctc = False
+                continue
+            if pending is not None:
+                kept.append(trim_window(*pending, offset + STREAM_OVERLAP_SECONDS / 2))
+            seconds_per_frame = waveform.shape[1] / SAMPLE_RATE / posteriors.size(0)
+            start_time = offset + STREAM_OVERLAP_SECONDS / 2 if offset > 0 else 0.0
+            pending = (posteriors, offset, seconds_per_frame, start_time)
+        if use_ctc and pending is not None:
+            kept.append(trim_window(*pending, float("inf")))
+    except Exception as e:
+        logger.error(f"Failed to decode audio {audio_path}: {e}")
+        return []
+    logger.info(f"Decoded {duration:.2f}s of audio for {base_name}")
+
+    if duration <= 0:
+        logger.warning(f"Skipping {base_name}: No audio loaded")
+        return []
+    log_probs = torch.cat(kept) if use_ctc and kept else None
+    return align_transcript(log_probs, targets, token_words, duration, words)
+
+# Build the ASS document with word highlighting, five words per line
+def build_ass(all_words):
+    lines = [ASS_HEADER]
+    for i in range(0, len(all_words), 5):
+        chunk = all_words[i:i + 5]
+        if not chunk:
+            continue
+        start_time = chunk[0]['time_start']
+        end_time = chunk[-1]['time_end']
+        if start_time >= end_time:
+            logger.warning(f"Invalid timing for chunk {i}: start={start_time}, end={end_time}")
+            continue
+        ass_text = ""
+        current_time = start_time * 100
+        for word in chunk:
+            dur_cs = int((word['time_end'] - word['time_start']) * 100)
+            if dur_cs <= 0:
+                logger.warning(f"Invalid duration for word {word['word']}: {dur_cs}")
+                continue
+            ass_text += f"{{\\t({int(current_time - start_time * 100)},{int(current_time - start_time * 100 + dur_cs)},,Highlight)}}{word['word']}{{\\t({int(current_time - start_time * 100 + dur_cs)},{int(current_time - start_time * 100 + dur_cs + 10)},,Default)}} "
+            current_time += dur_cs
+        lines.append(f"Dialogue: 0,{format_ass_time(start_time)},{format_ass_time(end_time)},Default,,0,0,0,,{ass_text.strip()}\n")
+    return "".join(lines)
+
+# Burn an ASS file into a video; returns True on success
+# Paths are separate argv elements and go to FFmpeg as they are; only the filter option needs escaping
+def burn_subtitles(video_path, ass_path, output_path, base_name):
+    try:
+        logger.info("Running FFmpeg to add subtitles...")
+        subtitle_cmd = [
+            "ffmpeg",
+            "-nostdin",
+            "-i", video_path,
+            "-vf", f"ass='{escape_filter_path(ass_path)}'",
+            "-c:v", "libx264",
+            "-c:a", "copy",
+            "-y",
+            output_path
+        ]
+        logger.info(f"FFmpeg command: {' '.join(subtitle_cmd)}")
+        result = subprocess.run(subtitle_cmd, check=True, capture_output=True, text=True)
+        logger.info(f"FFmpeg output: {result.stdout}")
+        logger.info(f"Successfully processed {base_name}")
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFmpeg failed for {base_name}: {e.stderr}")
+        return False
+
+# HTTP handler for the alignment service: POST /align with a JSON job, GET /health
+class AlignmentRequestHandler(BaseHTTPRequestHandler):
+    asr_model = None
+    model_lock = threading.Lock()  # One inference at a time; FFmpeg burns run outside the lock
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.end_headers()
+        self.wfile.write(b"ok\n")
+
+    def do_POST(self):
+        if self.path != "/align":
+            self.send_error(404)
+            return
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            audio_path, transcript_path = job["audio"], job["transcript"]
+            video_path, output_path = job.get("video"), job.get("output")
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error(400, f"Invalid job: {e}")
+            return
+        if not (os.path.exists(audio_path) and os.path.exists(transcript_path)):
+            self.send_error(404, "Audio or transcript file not found")
+            return
+
+        base_name = os.path.splitext(os.path.basename(audio_path))[0]
+        start = time.perf_counter()
+        with open(transcript_path, "r", encoding="utf-8") as f:
+            transcript = clean_text(f.read())
+        with self.model_lock:
+            all_words = align_file(self.asr_model, audio_path, transcript, base_name) if transcript else []
+        if not all_words:
+            self.send_error(422, f"No alignments generated for {base_name}")
+            return
+        ass_content = build_ass(all_words)
+        align_seconds = time.perf_counter() - start
+        logger.info(f"Aligned {len(all_words)} words for {base_name} in {align_seconds:.2f}s")
+
+        # Optionally burn the captions as well, with the service's FFmpeg
+        if video_path and output_path:
+            with tempfile.NamedTemporaryFile("w", suffix=".ass", delete=False, encoding="utf-8") as f:
+                f.write(ass_content)
+            try:
+                if not burn_subtitles(video_path, f.name, output_path, base_name):
+                    self.send_error(500, f"FFmpeg failed for {base_name}")
+                    return
+            finally:
+                os.remove(f.name)
+
+        body = ass_content.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/x-ass; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Aligned-Words", str(len(all_words)))
+        self.send_header("X-Align-Seconds", f"{align_seconds:.3f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info(f"Service request from {self.address_string()}: {format % args}")
+
+# Run the alignment service: load the model once and keep it warm for incoming jobs
+def serve(host, port):
+    if not check_ffmpeg():
+        logger.error("FFmpeg is not installed or not in PATH. Please install FFmpeg.")
+        return
+    AlignmentRequestHandler.asr_model = load_asr_model()
+    if AlignmentRequestHandler.asr_model is None:
+        return
+    server = ThreadingHTTPServer((host, port), AlignmentRequestHandler)
+    logger.info(f"Alignment service listening on http://{host}:{port} (POST /align, GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Alignment service stopped.")
+    finally:
+        server.server_close()
+
+# Submit one job to a running service and write the ASS output it streams back
+def submit(host, port, video_path, audio_path, transcript_path, output_path=None, ass_path=None):
+    job = {
+        "video": os.path.abspath(video_path), "audio": os.path.abspath(audio_path),
+        "transcript": os.path.abspath(transcript_path),
+        "output": os.path.abspath(output_path) if output_path else None,
+    }
+    request = urllib.request.Request(
+        f"http://{host}:{port}/align", data=json.dumps(job).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=SERVICE_TIMEOUT_SECONDS) as response:
+            out = open(ass_path, "wb") if ass_path else sys.stdout.buffer
+            try:
+                for block in iter(lambda: response.read(1 << 16), b""):
+                    out.write(block)
+            finally:
+                if ass_path:
+                    out.close()
+            logger.info(f"Aligned {response.headers.get('X-Aligned-Words')} words in {response.headers.get('X-Align-Seconds')}s")
+            return True
+    except urllib.error.HTTPError as e:
+        logger.error(f"Alignment service rejected the job: {e.code} {e.reason}")
+    except urllib.error.URLError as e:
+        logger.error(f"Alignment service not reachable at {host}:{port}: {e.reason}")
+    return False
+
+# Main processing
+def main():
+    # Verify FFmpeg
+    if not check_ffmpeg():
+        logger.error("FFmpeg is not installed or not in PATH. Please install FFmpeg.")
+        return
+
+    asr_model = load_asr_model()
+    if asr_model is None:
         return
 
     # Get list of video files
@@ -212,47 +499,7 @@ def main():
                 logger.warning(f"Skipping {base_name}: Empty transcript")
                 continue
 
-            # Split audio if necessary
-            audio_chunks = split_audio(audio_path)
-            all_words = []
-            offset = 0
-
-            # Process each audio chunk
-            for chunk_path in audio_chunks:
-                try:
-                    logger.info(f"Aligning chunk {chunk_path}...")
-                    waveform, sample_rate = load_audio(chunk_path)
-                    if waveform is None:
-                        logger.warning(f"Skipping chunk {chunk_path}: Failed to load audio")
-                        continue
-
-                    # Move waveform to the same device as the model
-                    device = next(asr_model.parameters()).device
-                    waveform = waveform.to(device)
-
-                    # Perform forced alignment
-                    alignments = align_transcript(asr_model, waveform, sample_rate, transcript)
-                    if not alignments:
-                        logger.warning(f"No alignments generated for chunk {chunk_path}")
-                        continue
-
-                    # Adjust timestamps by offset
-                    for word in alignments:
-                        word['time_start'] += offset
-                        word['time_end'] += offset
-                    all_words.extend(alignments)
-                    offset += torchaudio.info(chunk_path).num_frames / torchaudio.info(chunk_path).sample_rate
-                except Exception as e:
-                    logger.error(f"Alignment failed for chunk {chunk_path}: {e}")
-                    continue
-                finally:
-                    if chunk_path != audio_path and os.path.exists(chunk_path):
-                        try:
-                            os.remove(chunk_path)
-                            logger.info(f"Removed temporary chunk: {chunk_path}")
-                        except Exception as e:
-                            logger.error(f"Failed to remove chunk {chunk_path}: {e}")
-
+            all_words = align_file(asr_model, audio_path, transcript, base_name)
             if not all_words:
                 logger.warning(f"Skipping {base_name}: No alignments generated")
                 continue
@@ -261,64 +508,16 @@ def main():
 
             # Generate ASS file
             with open(ass_path, "w", encoding="utf-8") as f:
-                f.write(ASS_HEADER)
-                for i in range(0, len(all_words), 5):
-                    chunk = all_words[i:i + 5]
-                    if not chunk:
-                        continue
-                    start_time = chunk[0]['time_start']
-                    end_time = chunk[-1]['time_end']
-                    if start_time >= end_time:
-                        logger.warning(f"Invalid timing for chunk {i}: start={start_time}, end={end_time}")
-                        continue
-                    ass_text = ""
-                    current_time = start_time * 100
-                    for word in chunk:
-                        dur_cs = int((word['time_end'] - word['time_start']) * 100)
-                        if dur_cs <= 0:
-                            logger.warning(f"Invalid duration for word {word['word']}: {dur_cs}")
-                            continue
-                        ass_text += f"{{\\t({int(current_time - start_time * 100)},{int(current_time - start_time * 100 + dur_cs)},,Highlight)}}{word['word']}{{\\t({int(current_time - start_time * 100 + dur_cs)},{int(current_time - start_time * 100 + dur_cs + 10)},,Default)}} "
-                        current_time += dur_cs
-                    f.write(f"Dialogue: 0,{format_ass_time(start_time)},{format_ass_time(end_time)},Default,,0,0,0,,{ass_text.strip()}\n")
+                f.write(build_ass(all_words))
 
             if not os.path.exists(ass_path):
                 logger.error(f"ASS file {ass_path} not created.")
                 continue
 
             # Combine video with subtitles
-            temp_ass_path = None
             try:
-                logger.info("Running FFmpeg to add subtitles...")
-                temp_ass_path = os.path.join(tempfile.gettempdir(), f"temp_subtitle_{os.getpid()}.ass")
-                shutil.copy(ass_path, temp_ass_path)
-
-                video_path_escaped = escape_ffmpeg_path(video_path)
-                temp_ass_path_escaped = escape_ffmpeg_path(temp_ass_path)
-                output_path_escaped = escape_ffmpeg_path(output_path)
-
-                subtitle_cmd = [
-                    "ffmpeg",
-                    "-i", video_path_escaped,
-                    "-vf", f"ass={temp_ass_path_escaped}",
-                    "-c:v", "libx264",
-                    "-c:a", "copy",
-                    "-y",
-                    output_path_escaped
-                ]
-                logger.info(f"FFmpeg command: {' '.join(subtitle_cmd)}")
-                result = subprocess.run(subtitle_cmd, check=True, capture_output=True, text=True)
-                logger.info(f"FFmpeg output: {result.stdout}")
-                logger.info(f"Successfully processed {base_name}")
-            except subprocess.CalledProcessError as e:
-                logger.error(f"FFmpeg failed for {base_name}: {e.stderr}")
+                burn_subtitles(video_path, ass_path, output_path, base_name)
             finally:
-                if temp_ass_path and os.path.exists(temp_ass_path):
-                    try:
-                        os.remove(temp_ass_path)
-                        logger.info(f"Removed temporary ASS file: {temp_ass_path}")
-                    except Exception as e:
-                        logger.error(f"Failed to remove temporary ASS file {temp_ass_path}: {e}")
                 if os.path.exists(ass_path):
                     try:
                         os.remove(ass_path)
@@ -333,4 +532,17 @@ def main():
     logger.info("Processing complete.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Align transcripts to audio and burn word-highlighted captions.")
+    parser.add_argument("--serve", action="store_true", help="Keep the model loaded and accept alignment jobs over local HTTP")
+    parser.add_argument("--submit", nargs=3, metavar=("VIDEO", "AUDIO", "TRANSCRIPT"), help="Send one job to a running service")
+    parser.add_argument("--output", help="With --submit: also burn the captions into this video")
+    parser.add_argument("--ass", help="With --submit: write the returned ASS file here (default: stdout)")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.host, args.port)
+    elif args.submit:
+        sys.exit(0 if submit(args.host, args.port, *args.submit, output_path=args.output, ass_path=args.ass) else 1)
+    else:
+        main()
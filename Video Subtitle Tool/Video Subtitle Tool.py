@@ -1,11 +1,11 @@
 import os
+import json
+import time
+import tempfile
+import threading
 import subprocess
 import logging
-try:
-    from moviepy import VideoFileClip
-except ImportError as e:
-    print(f"Failed to import moviepy.editor: {e}")
-    exit(1)
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Setup logging
 logging.basicConfig(
@@ -20,15 +20,25 @@ VIDEO_FOLDER = r"Video"
 SUBTITLE_FOLDER = r"Done"
 OUTPUT_FOLDER = r"OUTPUT"
 
+# Video validation tier: "probe" reads container headers only (fast, also gives duration),
+# "sample" additionally decodes a few seconds at several offsets, "full" decodes every frame
+VALIDATION_MODE = "probe"
+SAMPLE_POINTS = 3  # Offsets decoded in "sample" mode, spread evenly over the video
+SAMPLE_SECONDS = 2  # Seconds decoded at each offset
+
+# Batch encoding: several FFmpeg jobs run at once and the cores are split between them
+PARALLEL_JOBS = 0  # 0 = one job per THREADS_PER_JOB_TARGET cores
+THREADS_PER_JOB_TARGET = 8  # libx264 scales poorly past ~8 threads at 1080p
+JOB_TIMEOUT_SECONDS = 3600  # Kill an FFmpeg job that runs longer than this
+JOB_RETRIES = 1  # Extra attempts for a failed or timed-out job
+PROGRESS_INTERVAL_SECONDS = 5  # Minimum time between aggregate progress log lines
+
 # Ensure output directory exists
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-def escape_ffmpeg_path(path):
-    """Escape file paths for FFmpeg, handling special characters."""
-    path = os.path.normpath(path)
-    # Replace backslashes with forward slashes and escape quotes
-    path = path.replace('\\', '/').replace('"', '\\"')
-    return f'"{path}"'
+def escape_filter_path(path):
+    """Escape a path for use inside a single-quoted FFmpeg filter option."""
+    return path.replace('\\', '\\\\').replace(':', '\\:').replace(',', '\\,')
 
 def check_ffmpeg():
     """Check if FFmpeg is installed."""
@@ -40,22 +50,88 @@ def check_ffmpeg():
         logger.error(f"FFmpeg is not installed or not in PATH: {e}")
         return False
 
-def validate_video_file(video_path):
-    """Validate that a video file exists and is readable."""
-    if not os.path.exists(video_path):
-        logger.error(f"Video file does not exist: {video_path}")
-        return False
+def probe_video(video_path):
+    """Read container and stream headers with ffprobe; returns a dict with duration and stream info, or None."""
     try:
-        # Test if FFmpeg can read the file
-        subprocess.run(
-            ["ffmpeg", "-i", escape_ffmpeg_path(video_path), "-f", "null", "-"],
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", video_path],
             capture_output=True, text=True, check=True
         )
+        data = json.loads(result.stdout)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError) as e:
+        logger.error(f"ffprobe could not read {video_path}: {getattr(e, 'stderr', None) or e}")
+        return None
+
+    streams = data.get("streams", [])
+    video_streams = [s for s in streams if s.get("codec_type") == "video"]
+    audio_streams = [s for s in streams if s.get("codec_type") == "audio"]
+    # Prefer the container duration; fall back to the longest stream for formats that omit it
+    duration = data.get("format", {}).get("duration")
+    if duration in (None, "N/A"):
+        duration = max([float(s["duration"]) for s in streams if s.get("duration") not in (None, "N/A")] or [0.0])
+
+    video = video_streams[0] if video_streams else {}
+    return {
+        "duration": float(duration),
+        "video_streams": len(video_streams),
+        "audio_streams": len(audio_streams),
+        "video_codec": video.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+    }
+
+def decode_check(video_path, start=None, seconds=None):
+    """Decode the first video stream (optionally a window of it) and stop at the first decoding error."""
+    cmd = ["ffmpeg", "-v", "error", "-xerror"]
+    if start is not None:
+        cmd += ["-ss", f"{start:.3f}"]
+    cmd += ["-i", video_path]
+    if seconds is not None:
+        cmd += ["-t", f"{seconds:.3f}"]
+    cmd += ["-map", "0:v:0", "-f", "null", "-"]
+    try:
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
         return True
     except subprocess.CalledProcessError as e:
-        logger.error(f"Invalid or corrupted video file {video_path}: {e.stderr}")
+        where = f" at {start:.1f}s" if start is not None else ""
+        logger.error(f"Decoding failed for {video_path}{where}: {e.stderr.strip()}")
         return False
 
+def validate_video_file(video_path, mode=None):
+    """Validate that a video file exists and is readable.
+
+    Returns the probe info (duration and stream details) on success, None otherwise.
+    """
+    mode = mode or VALIDATION_MODE
+    if mode not in ("probe", "sample", "full"):
+        logger.error(f"Unknown validation mode: {mode}")
+        return None
+    if not os.path.exists(video_path):
+        logger.error(f"Video file does not exist: {video_path}")
+        return None
+
+    info = probe_video(video_path)
+    if info is None:
+        return None
+    if not info["video_streams"]:
+        logger.error(f"No video stream in {video_path}")
+        return None
+    if info["duration"] <= 0:
+        logger.error(f"Could not determine duration of {video_path}")
+        return None
+
+    if mode == "sample":
+        # Decode a short window centred in each of SAMPLE_POINTS equal slices of the video
+        seconds = min(SAMPLE_SECONDS, info["duration"] / SAMPLE_POINTS)
+        for k in range(SAMPLE_POINTS):
+            start = max((k + 0.5) * info["duration"] / SAMPLE_POINTS - seconds / 2, 0.0)
+            if not decode_check(video_path, start, seconds):
+                return None
+    elif mode == "full":
+        if not decode_check(video_path):
+            return None
+    return info
+
 def create_srt_from_txt(txt_path, video_duration, output_srt_path):
     """Create a simple SRT file from a text transcript with estimated timings."""
     try:
@@ -90,34 +166,167 @@ def create_srt_from_txt(txt_path, video_duration, output_srt_path):
         logger.error(f"Failed to create SRT from {txt_path}: {e}")
         return False
 
-def add_captions_to_video(video_path, subtitle_path, output_path):
-    """Add captions to a video using FFmpeg."""
+class BatchProgress:
+    """Aggregate progress of concurrent FFmpeg jobs, reported from their -progress output."""
+
+    def __init__(self, jobs):
+        self.lock = threading.Lock()
+        self.total = {job["base_name"]: job["duration"] for job in jobs}
+        self.done = dict.fromkeys(self.total, 0.0)
+        self.finished = 0
+        self.failed = 0
+        self.last_report = 0.0
+
+    def update(self, base_name, seconds):
+        with self.lock:
+            self.done[base_name] = min(seconds, self.total[base_name])
+            self._report()
+
+    def finish(self, base_name, ok=True):
+        with self.lock:
+            # A failed job encoded nothing that is kept
+            self.done[base_name] = self.total[base_name] if ok else 0.0
+            if ok:
+                self.finished += 1
+            else:
+                self.failed += 1
+            self._report(force=True)
+
+    def _report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_report < PROGRESS_INTERVAL_SECONDS:
+            return
+        self.last_report = now
+        percent = 100 * sum(self.done.values()) / max(sum(self.total.values()), 1e-9)
+        logger.info(
+            f"Progress: {self.finished}/{len(self.total)} videos finished, {self.failed} failed, "
+            f"{percent:.1f}% of total video time encoded"
+        )
+
+def add_captions_to_video(video_path, subtitle_path, output_path, threads=0, on_progress=None, timeout=None):
+    """Add captions to a video using FFmpeg.
+
+    Encoding progress is read from FFmpeg's -progress pipe and passed to on_progress as seconds
+    of output written. The process is killed if it runs longer than timeout seconds.
+    """
     try:
-        video_path_escaped = escape_ffmpeg_path(video_path)
-        subtitle_path_escaped = escape_ffmpeg_path(subtitle_path)
-        output_path_escaped = escape_ffmpeg_path(output_path)
+        subtitle_path_escaped = escape_filter_path(subtitle_path)
 
         cmd = [
             "ffmpeg",
-            "-i", video_path_escaped,
-            "-vf", f"subtitles={subtitle_path_escaped}",
+            "-nostdin",
+            "-nostats", "-progress", "pipe:1",
+            "-i", video_path,
+            "-vf", f"subtitles='{subtitle_path_escaped}'",
             "-c:v", "libx264",
             "-preset", "fast",
+            "-threads", str(threads),
             "-c:a", "copy",
             "-y",
-            output_path_escaped
+            output_path
         ]
         logger.info(f"Running FFmpeg command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        logger.info(f"FFmpeg output: {result.stdout}")
+        # stderr goes to a temporary file so a chatty encoder cannot block on a full pipe
+        with tempfile.TemporaryFile(mode="w+", encoding="utf-8", errors="replace") as stderr_file:
+            # No terminal input: a keypress would stop one job early with exit code 0, and a
+            # backgrounded batch would stop on SIGTTIN until the timeout killed it
+            process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr_file, text=True)
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                process.kill()
+
+            timer = threading.Timer(timeout, kill) if timeout else None
+            if timer:
+                timer.start()
+            try:
+                for line in process.stdout:
+                    key, _, value = line.strip().partition("=")
+                    # out_time_us (and the misnamed out_time_ms) are microseconds
+                    if key in ("out_time_us", "out_time_ms") and value.isdigit() and on_progress:
+                        on_progress(int(value) / 1e6)
+                process.wait()
+            finally:
+                if timer:
+                    timer.cancel()
+            if timed_out.is_set():
+                logger.error(f"FFmpeg timed out after {timeout}s for {video_path}")
+                return False
+            if process.returncode != 0:
+                stderr_file.seek(0)
+                logger.error(f"FFmpeg failed: {stderr_file.read()[-2000:]}")
+                return False
         return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"FFmpeg failed: {e.stderr}")
-        return False
     except Exception as e:
         logger.error(f"Error adding captions to {video_path}: {e}")
         return False
 
+def prepare_job(video_file):
+    """Validate a video and make sure it has subtitles; returns a job dict or None to skip it."""
+    base_name = os.path.splitext(video_file)[0]
+    video_path = os.path.join(VIDEO_FOLDER, video_file)
+    subtitle_path = os.path.join(SUBTITLE_FOLDER, f"{base_name}.srt")
+    txt_path = os.path.join(SUBTITLE_FOLDER, f"{base_name}.txt")
+    output_path = os.path.join(OUTPUT_FOLDER, f"{base_name}_captioned.mp4")
+
+    # Validate video file; the probe also gives the duration
+    info = validate_video_file(video_path)
+    if info is None:
+        logger.warning(f"Skipping {base_name}: Invalid or inaccessible video file")
+        return None
+    video_duration = info["duration"]
+    logger.info(
+        f"{base_name}: {video_duration:.2f}s, {info['video_codec']} {info['width']}x{info['height']}, "
+        f"{info['audio_streams']} audio stream(s)"
+    )
+
+    # Create SRT if needed
+    if not os.path.exists(subtitle_path) and os.path.exists(txt_path):
+        logger.info(f"No SRT found for {base_name}, creating from {txt_path}")
+        if not create_srt_from_txt(txt_path, video_duration, subtitle_path):
+            logger.warning(f"Skipping {base_name}: Failed to create SRT")
+            return None
+
+    if not os.path.exists(subtitle_path):
+        logger.warning(f"Skipping {base_name}: No subtitle file (.srt) or transcript (.txt) found")
+        return None
+
+    return {
+        "base_name": base_name, "video_path": video_path, "subtitle_path": subtitle_path,
+        "output_path": output_path, "duration": video_duration,
+    }
+
+def run_job(job, threads, progress):
+    """Encode one job, retrying failed or timed-out attempts up to JOB_RETRIES times.
+
+    The partial output of a job that fails every attempt is deleted.
+    """
+    base_name = job["base_name"]
+    for attempt in range(1, JOB_RETRIES + 2):
+        if attempt > 1:
+            logger.warning(f"Retrying {base_name} (attempt {attempt} of {JOB_RETRIES + 1})")
+            progress.update(base_name, 0.0)
+        if add_captions_to_video(
+            job["video_path"], job["subtitle_path"], job["output_path"], threads=threads,
+            on_progress=lambda seconds: progress.update(base_name, seconds), timeout=JOB_TIMEOUT_SECONDS
+        ):
+            return True
+    if os.path.exists(job["output_path"]):
+        try:
+            os.remove(job["output_path"])
+            logger.info(f"Removed partial output {job['output_path']}")
+        except OSError as e:
+            logger.error(f"Failed to remove partial output {job['output_path']}: {e}")
+    return False
+
+def get_worker_counts(job_count):
+    """Choose how many FFmpeg jobs run at once and how many threads each one gets."""
+    cores = os.cpu_count() or 1
+    workers = PARALLEL_JOBS or max(1, cores // THREADS_PER_JOB_TARGET)
+    workers = max(1, min(workers, job_count))
+    return workers, max(1, cores // workers)
+
 def main():
     """Main function to process videos and add captions."""
     if not check_ffmpeg():
@@ -127,48 +336,41 @@ def main():
     video_files = [f for f in os.listdir(VIDEO_FOLDER) if f.lower().endswith(".mp4")]
     logger.info(f"Found {len(video_files)} video files: {video_files}")
 
+    jobs = []
     for video_file in video_files:
         try:
-            base_name = os.path.splitext(video_file)[0]
-            video_path = os.path.join(VIDEO_FOLDER, video_file)
-            subtitle_path = os.path.join(SUBTITLE_FOLDER, f"{base_name}.srt")
-            txt_path = os.path.join(SUBTITLE_FOLDER, f"{base_name}.txt")
-            output_path = os.path.join(OUTPUT_FOLDER, f"{base_name}_captioned.mp4")
-
-            # Validate video file
-            if not validate_video_file(video_path):
-                logger.warning(f"Skipping {base_name}: Invalid or inaccessible video file")
-                continue
-
-            # Get video duration
+            job = prepare_job(video_file)
+            if job:
+                jobs.append(job)
+        except Exception as e:
+            logger.error(f"Error processing {video_file}: {e}")
+    if not jobs:
+        logger.info("Processing complete.")
+        return
+
+    workers, threads = get_worker_counts(len(jobs))
+    logger.info(f"Encoding {len(jobs)} videos with {workers} parallel FFmpeg jobs, {threads} threads each")
+    progress = BatchProgress(jobs)
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job, threads, progress): job["base_name"] for job in jobs}
+        for future in as_completed(futures):
+            base_name = futures[future]
             try:
-                video = VideoFileClip(video_path)
-                video_duration = video.duration
-                video.close()
+                ok = future.result()
             except Exception as e:
-                logger.error(f"Failed to get duration for {video_path}: {e}")
-                continue
-
-            # Create SRT if needed
-            if not os.path.exists(subtitle_path) and os.path.exists(txt_path):
-                logger.info(f"No SRT found for {base_name}, creating from {txt_path}")
-                if not create_srt_from_txt(txt_path, video_duration, subtitle_path):
-                    logger.warning(f"Skipping {base_name}: Failed to create SRT")
-                    continue
-
-            if not os.path.exists(subtitle_path):
-                logger.warning(f"Skipping {base_name}: No subtitle file (.srt) or transcript (.txt) found")
-                continue
-
-            if add_captions_to_video(video_path, subtitle_path, output_path):
+                logger.error(f"Error processing {base_name}: {e}")
+                ok = False
+            progress.finish(base_name, ok)
+            if ok:
                 logger.info(f"Processed {base_name} successfully")
             else:
+                failed.append(base_name)
                 logger.error(f"Failed to process {base_name}")
-        except Exception as e:
-            logger.error(f"Error processing {video_file}: {e}")
-            continue
 
+    if failed:
+        logger.warning(f"{len(failed)} video(s) failed: {failed}")
     logger.info("Processing complete.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
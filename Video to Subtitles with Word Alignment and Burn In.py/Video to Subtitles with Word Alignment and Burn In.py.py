@@ -1,15 +1,62 @@
 import os
 import subprocess
 import re
+import json
+import hashlib
+import time
+import tempfile
+import numpy as np
 import torch
 import torchaudio
-import warnings
 import psutil
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from typing import List
 
-# Suppress torchcodec warning
-warnings.filterwarnings("ignore", category=UserWarning, module="torchaudio._backend.utils")
+# Check the fast trellis against the reference tensor loop on every file (slow, for regression runs)
+VERIFY_TRELLIS = False
+
+# Emission settings: long audio goes through the model in overlapping windows so memory stays bounded
+EMISSION_WINDOW_SECONDS = 30  # Audio per window whose frames are kept
+EMISSION_CONTEXT_SECONDS = 2  # Extra audio on each side of a window, dropped when stitching
+EMISSION_MEMMAP_MB = 128  # Spill the stitched emission matrix to a memory-mapped file above this size
+
+# wav2vec2 feature extractor geometry: one frame per 320 samples with a 400-sample receptive field
+FRAME_STRIDE = 320
+FRAME_WINDOW = 400
+
+# Alignment settings: long transcripts are split into sentence regions, each aligned on its own small trellis
+REGION_WORDS = 100  # Target words per region; transcripts up to this length use one trellis
+ANCHOR_SNAP_SECONDS = 2.0  # How far a coarse region boundary may move to land on a pause
+PAUSE_SECONDS = 0.2  # Window for measuring how blank-dominated (silent) the audio around a boundary is
+REGION_MIN_CONFIDENCE = 0.25  # Flag regions whose mean word score is below this
+ALIGN_WORKERS = os.cpu_count() or 1
+
+# Alignment cache: word segments and timestamp ratio per audio file and transcript, so restyling skips the model
+USE_ALIGNMENT_CACHE = True
+ALIGNMENT_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alignment_cache")
+ALIGNMENT_CACHE_MAX_MB = 500  # Least recently used entries are evicted above this size
+BUNDLE_NAME = "WAV2VEC2_ASR_BASE_960H"
+
+# Batched inference: short clips of similar length share one encoder pass
+# The feature extractor runs on each clip unpadded (its group norm spans the whole time axis), so only
+# the transformer encoder sees padding, which it zeroes and masks; RUN_BATCHING_BENCHMARK checks the result
+USE_BATCHED_EMISSIONS = True  # False runs every clip on its own
+BATCH_MAX_SECONDS = 90  # Longer files run on their own, in windows above EMISSION_WINDOW_SECONDS + 2 * EMISSION_CONTEXT_SECONDS
+BATCH_QUEUE_CLIPS = 64  # Decoded clips held before their batches are run
+MAX_BATCH_SIZE = 16
+MAX_BATCH_MEMORY_MB = 4096  # Estimated activation memory per forward pass
+BATCH_LENGTH_SPREAD = 1.15  # Longest clip in a batch is at most this much longer than the shortest (bounds the padding)
+
+# Quantized inference: dynamic int8 Linear layers, cached on disk so startup does not re-quantize
+USE_QUANTIZED_MODEL = False
+QUANTIZED_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"wav2vec2_base_960h_int8_torch{torch.__version__}.pt")
+
+# Benchmark int8 against float32 on fixture clips (.mp3/.wav with a matching .txt) instead of processing videos
+RUN_QUANTIZATION_BENCHMARK = False
+# Compare batched against single-clip emissions on the same fixture clips instead of processing videos
+RUN_BATCHING_BENCHMARK = False
+BENCHMARK_FOLDER = r"Your Folder"
 
 # Define directories
 TEST_FOLDER = r"Your Folder"
@@ -17,21 +64,6 @@ AUDIO_FOLDER = r"Your Folder"
 VIDEO_FOLDER = r"Your Folder"
 OUTPUT_FOLDER = r"Your Folder"
 
-# Verify directories exist
-print(f"Checking directories:")
-print(f"  Video folder: {VIDEO_FOLDER} - Exists: {os.path.exists(VIDEO_FOLDER)}")
-print(f"  Audio folder: {AUDIO_FOLDER} - Exists: {os.path.exists(AUDIO_FOLDER)}")
-print(f"  Text folder: {TEST_FOLDER} - Exists: {os.path.exists(TEST_FOLDER)}")
-print(f"  Output folder: {OUTPUT_FOLDER} - Exists: {os.path.exists(OUTPUT_FOLDER)}")
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
-# Point dataclass
-@dataclass
-class Point:
-    token_index: int
-    time_index: int
-    score: float
-
 # Segment dataclass
 @dataclass
 class Segment:
@@ -47,6 +79,24 @@ class Segment:
     def length(self):
         return self.end - self.start
 
+# Columnar segments: one entry per segment in parallel arrays, indexing returns a Segment
+@dataclass
+class Segments:
+    labels: List[str]
+    start: np.ndarray
+    end: np.ndarray
+    score: np.ndarray
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, i):
+        return Segment(self.labels[i], int(self.start[i]), int(self.end[i]), float(self.score[i]))
+
+    @property
+    def length(self):
+        return self.end - self.start
+
 # Function to get trellis
 def get_trellis(emission, tokens, blank_id=0):
     num_frame = emission.size(0)
@@ -57,6 +107,30 @@ def get_trellis(emission, tokens, blank_id=0):
     trellis[0, 1:] = -float("inf")
     trellis[-num_tokens + 1 :, 0] = float("inf")
 
+    # Same float32 additions and maxima as the tensor loop, but each frame is three in-place
+    # NumPy ops on views of the trellis instead of several small torch kernel launches
+    trellis_np = trellis.numpy()
+    emission_np = emission.detach().cpu().numpy()
+    blank = emission_np[:, blank_id].copy()
+    token_emission = emission_np[:, tokens[1:]]  # Gathered once: (num_frame, num_tokens - 1)
+    stay = np.empty(num_tokens - 1, dtype=trellis_np.dtype)
+    for t in range(num_frame - 1):
+        row = trellis_np[t + 1, 1:]
+        np.add(trellis_np[t, 1:], blank[t], out=stay)
+        np.add(trellis_np[t, :-1], token_emission[t], out=row)
+        np.maximum(stay, row, out=row)
+    return trellis
+
+# Function to get trellis with the original tensor loop (reference for VERIFY_TRELLIS)
+def get_trellis_reference(emission, tokens, blank_id=0):
+    num_frame = emission.size(0)
+    num_tokens = len(tokens)
+
+    trellis = torch.zeros((num_frame, num_tokens))
+    trellis[1:, 0] = torch.cumsum(emission[1:, blank_id], 0)
+    trellis[0, 1:] = -float("inf")
+    trellis[-num_tokens + 1 :, 0] = float("inf")
+
     for t in range(num_frame - 1):
         trellis[t + 1, 1:] = torch.maximum(
             trellis[t, 1:] + emission[t, blank_id],
@@ -65,70 +139,423 @@ def get_trellis(emission, tokens, blank_id=0):
     return trellis
 
 # Function to backtrack
+# Returns the path as (token index per frame, score per frame); the frame is the array position
 def backtrack(trellis, emission, tokens, blank_id=0):
-    t, j = trellis.size(0) - 1, trellis.size(1) - 1
-    path = [Point(j, t, emission[t, blank_id].exp().item())]
+    trellis_np = trellis.numpy()
+    emission_np = emission.detach().cpu().numpy()
+    num_frame = trellis_np.shape[0]
+    token_index = np.zeros(num_frame, dtype=np.int64)  # Frames before the first token stay on token 0
+    changed_at = np.zeros(num_frame, dtype=bool)
 
+    t, j = num_frame - 1, trellis_np.shape[1] - 1
+    token_index[t] = j
     while j > 0:
         assert t > 0
-        p_stay = emission[t - 1, blank_id]
-        p_change = emission[t - 1, tokens[j]]
-
-        stayed = trellis[t - 1, j] + p_stay
-        changed = trellis[t - 1, j - 1] + p_change
-
+        stayed = trellis_np[t - 1, j] + emission_np[t - 1, blank_id]
+        changed = trellis_np[t - 1, j - 1] + emission_np[t - 1, tokens[j]]
         t -= 1
         if changed > stayed:
+            changed_at[t] = True
             j -= 1
-        prob = (p_change if changed > stayed else p_stay).exp().item()
-        path.append(Point(j, t, prob))
-
-    while t > 0:
-        prob = emission[t - 1, blank_id].exp().item()
-        path.append(Point(j, t - 1, prob))
-        t -= 1
+        token_index[t] = j
 
-    return path[::-1]
+    # A frame that changed token is scored by the token it changed from, every other frame by blank
+    tokens_np = np.asarray(tokens)
+    next_token = tokens_np[np.minimum(token_index + 1, len(tokens_np) - 1)]
+    scored_column = np.where(changed_at, next_token, blank_id)
+    scores = np.exp(emission_np[np.arange(num_frame), scored_column].astype(np.float64))
+    return token_index, scores
 
 # Function to merge repeats
 def merge_repeats(path, transcript):
-    i1, i2 = 0, 0
-    segments = []
-    while i1 < len(path):
-        while i2 < len(path) and path[i1].token_index == path[i2].token_index:
-            i2 += 1
-        score = sum(path[k].score for k in range(i1, i2)) / (i2 - i1)
-        segments.append(
-            Segment(
-                transcript[path[i1].token_index],
-                path[i1].time_index,
-                path[i2 - 1].time_index + 1,
-                score,
-            )
-        )
-        i1 = i2
-    return segments
+    token_index, scores = path
+    # Run-length encode the token index per frame
+    boundaries = np.flatnonzero(np.diff(token_index)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(token_index)]))
+    run_scores = np.add.reduceat(scores, starts) / (ends - starts)
+    labels = [transcript[j] for j in token_index[starts]]
+    return Segments(labels, starts, ends, run_scores)
 
 # Function to merge words
-def merge_words(segments: List[Segment], separator: str = "|") -> List[Segment]:
-    words = []
-    i1, i2 = 0, 0
-    while i1 < len(segments):
-        if i2 >= len(segments) or segments[i2].label == separator:
-            if i1 != i2:
-                seg = segments[i1]
-                if i1 > 0:
-                    seg.score = sum(segments[k].score * segments[k].length for k in range(i1, i2)) / sum(segments[k].length for k in range(i1, i2))
-                else:
-                    seg.score = sum(segments[k].score for k in range(i1, i2)) / (i2 - i1)
-                word = "".join([s.label for s in segments[i1:i2]])
-                seg = Segment(word, segments[i1].start, segments[i2 - 1].end + 1, seg.score)
-                words.append(seg)
-            i1 = i2 + 1
-            i2 = i1
+def merge_words(segments: Segments, separator: str = "|") -> Segments:
+    is_word = np.fromiter((label != separator for label in segments.labels), dtype=bool, count=len(segments))
+    edges = np.diff(np.concatenate(([0], is_word.astype(np.int8), [0])))
+    first = np.flatnonzero(edges == 1)  # First segment of each word
+    stop = np.flatnonzero(edges == -1)  # One past the last segment of each word
+
+    # Word scores from cumulative sums: length-weighted, except a word starting at the first segment
+    lengths = segments.length
+    weighted_sum = np.concatenate(([0.0], np.cumsum(segments.score * lengths)))
+    length_sum = np.concatenate(([0], np.cumsum(lengths)))
+    score_sum = np.concatenate(([0.0], np.cumsum(segments.score)))
+    weighted = (weighted_sum[stop] - weighted_sum[first]) / np.maximum(length_sum[stop] - length_sum[first], 1)
+    mean = (score_sum[stop] - score_sum[first]) / (stop - first)
+    scores = np.where(first > 0, weighted, mean)
+
+    labels = ["".join(segments.labels[a:b]) for a, b in zip(first, stop)]
+    return Segments(labels, segments.start[first], segments.end[stop - 1] + 1, scores)
+
+# Function to split a transcript into alignment regions of whole sentences
+def split_regions(raw_text, region_words=REGION_WORDS):
+    regions = []
+    current = []
+    for sentence in re.split(r"(?<=[.!?])\s+|\n\s*\n", raw_text):
+        words = clean_text(sentence).split()
+        if current and len(current) + len(words) > region_words:
+            regions.append(current)
+            current = []
+        # Sentences longer than a region are cut into region-sized pieces
+        while len(words) > region_words:
+            regions.append(words[:region_words])
+            words = words[region_words:]
+        current += words
+    if current:
+        regions.append(current)
+    return regions
+
+# Function to anchor region boundaries to emission frames (coarse pass)
+# Each boundary starts where the cumulative non-blank probability reaches the share of transcript tokens
+# before it, then moves to the most blank-dominated frame within ANCHOR_SNAP_SECONDS (a pause between words)
+def anchor_regions(emission_np, region_token_counts, frames_per_second, blank_id=0):
+    num_frame = emission_np.shape[0]
+    blank_prob = np.exp(emission_np[:, blank_id].astype(np.float64))
+    mass = np.cumsum(1.0 - blank_prob)
+    pause_frames = max(1, int(PAUSE_SECONDS * frames_per_second))
+    pause = np.convolve(blank_prob, np.ones(pause_frames) / pause_frames, mode="same")
+    radius = int(ANCHOR_SNAP_SECONDS * frames_per_second)
+    total_tokens = sum(region_token_counts)
+
+    boundaries = [0]
+    consumed = 0
+    for count in region_token_counts[:-1]:
+        consumed += count
+        estimate = int(np.searchsorted(mass, mass[-1] * consumed / total_tokens))
+        # Every region needs at least one frame per token
+        lo = max(estimate - radius, boundaries[-1] + count)
+        hi = min(estimate + radius, num_frame - (total_tokens - consumed))
+        if lo <= hi:
+            boundaries.append(lo + int(np.argmax(pause[lo:hi + 1])))
         else:
-            i2 += 1
-    return words
+            boundaries.append(min(max(estimate, boundaries[-1] + count), num_frame))
+    boundaries.append(num_frame)
+    return boundaries
+
+# Function to set up an alignment worker process
+def init_align_worker():
+    torch.set_num_threads(1)  # Regions already run in parallel across processes
+
+# Function to align one region on its own trellis; frames in the result are relative to the region
+def align_region(emission_np, tokens, transcript):
+    emission = torch.from_numpy(emission_np)
+    trellis = get_trellis(emission, tokens)
+    if VERIFY_TRELLIS and not torch.equal(trellis, get_trellis_reference(emission, tokens)):
+        print(f"Warning: trellis differs from the reference implementation for region '{transcript[:40]}'")
+    path = backtrack(trellis, emission, tokens)
+    segments = merge_repeats(path, transcript)
+    return merge_words(segments)
+
+# Function to align a transcript split into regions: one trellis for a single region, hierarchical otherwise
+def align_transcript(executor, emission, regions, dictionary, frames_per_second):
+    region_transcripts = ["|" + "|".join(word.upper() for word in region) + "|" for region in regions]
+    emission_np = emission.numpy()
+    if len(regions) == 1:
+        tokens = [dictionary[c] for c in region_transcripts[0]]
+        word_segments = align_region(emission_np, tokens, region_transcripts[0])
+        return word_segments, [float(np.mean(word_segments.score))]
+    return align_hierarchical(executor, emission_np, region_transcripts, dictionary, frames_per_second)
+
+# Function to align a transcript region by region: coarse anchors, then the small trellises in parallel
+# Returns the word segments in file frames and one confidence (mean word score) per region
+def align_hierarchical(executor, emission_np, region_transcripts, dictionary, frames_per_second, blank_id=0):
+    region_tokens = [[dictionary[c] for c in transcript] for transcript in region_transcripts]
+    boundaries = anchor_regions(emission_np, [len(tokens) for tokens in region_tokens], frames_per_second, blank_id)
+    futures = [
+        executor.submit(align_region, np.ascontiguousarray(emission_np[start:end]), tokens, transcript)
+        for start, end, tokens, transcript in zip(boundaries[:-1], boundaries[1:], region_tokens, region_transcripts)
+    ]
+    parts = [future.result() for future in futures]
+    word_segments = Segments(
+        [label for part in parts for label in part.labels],
+        np.concatenate([part.start + offset for part, offset in zip(parts, boundaries)]),
+        np.concatenate([part.end + offset for part, offset in zip(parts, boundaries)]),
+        np.concatenate([part.score for part in parts]),
+    )
+    region_scores = [float(np.mean(part.score)) if len(part) else 0.0 for part in parts]
+    return word_segments, region_scores
+
+# Function to allocate the emission matrix, memory-mapped when large
+def allocate_emission(num_frame, num_labels):
+    size_mb = num_frame * num_labels * 4 / 1024 / 1024
+    if size_mb <= EMISSION_MEMMAP_MB:
+        return np.empty((num_frame, num_labels), dtype=np.float32)
+    print(f"Emission matrix is {size_mb:.2f} MB, spilling to a memory-mapped file")
+    spill_file = tempfile.TemporaryFile(dir=OUTPUT_FOLDER)
+    return np.memmap(spill_file, dtype=np.float32, mode="w+", shape=(num_frame, num_labels))
+
+# Function to get log-softmax emissions window by window
+# Each window carries EMISSION_CONTEXT_SECONDS of audio on both sides; only its central frames are kept,
+# so the stitched matrix has exactly the frames a single pass over the whole waveform would produce
+def get_emissions_chunked(model, waveform, sample_rate, device):
+    num_frame = (waveform.size(1) - FRAME_WINDOW) // FRAME_STRIDE + 1
+    hop = max(1, int(EMISSION_WINDOW_SECONDS * sample_rate) // FRAME_STRIDE)
+    context = int(EMISSION_CONTEXT_SECONDS * sample_rate) // FRAME_STRIDE
+    emission = None
+    peak_memory = get_memory_usage()
+    for first in range(0, num_frame, hop):
+        last = min(first + hop, num_frame)
+        window_first = max(0, first - context)
+        window_last = min(num_frame, last + context)
+        start_sample = window_first * FRAME_STRIDE
+        end_sample = (window_last - 1) * FRAME_STRIDE + FRAME_WINDOW
+        window_emission, _ = model(waveform[:, start_sample:end_sample].to(device))
+        window_emission = torch.log_softmax(window_emission[0], dim=-1)
+        if emission is None:
+            emission = allocate_emission(num_frame, window_emission.size(1))
+        emission[first:last] = window_emission[first - window_first:last - window_first].cpu().numpy()
+        del window_emission
+        peak_memory = max(peak_memory, get_memory_usage())
+    return torch.from_numpy(emission), peak_memory
+
+# Function to check whether a waveform's emissions are computed in windows when it runs on its own
+def uses_emission_windows(num_samples, sample_rate):
+    return num_samples > (EMISSION_WINDOW_SECONDS + 2 * EMISSION_CONTEXT_SECONDS) * sample_rate
+
+# Function to check whether a waveform goes through a batched forward pass with other short clips
+def uses_batched_emissions(num_samples, sample_rate):
+    return USE_BATCHED_EMISSIONS and num_samples <= BATCH_MAX_SECONDS * sample_rate
+
+# Function to compute log-softmax emissions for a mono waveform, in windows when long
+# Returns the emission matrix and the peak memory usage seen while computing it
+def compute_emission(model, waveform, sample_rate, device):
+    with torch.inference_mode():
+        if uses_emission_windows(waveform.size(1), sample_rate):
+            return get_emissions_chunked(model, waveform, sample_rate, device)
+        emissions, _ = model(waveform.to(device))
+        emissions = torch.log_softmax(emissions, dim=-1)
+        return emissions[0].cpu().detach(), get_memory_usage()
+
+# Function to load the acoustic model, optionally dynamic int8 quantized
+def load_model(bundle, device, quantized=False):
+    if quantized and os.path.exists(QUANTIZED_MODEL_PATH):
+        try:
+            model = torch.load(QUANTIZED_MODEL_PATH, map_location=device, weights_only=False)
+            print(f"Loaded cached int8 model from {QUANTIZED_MODEL_PATH}")
+            return model.eval()
+        except Exception as e:
+            print(f"Failed to load cached int8 model, quantizing again: {e}")
+    model = bundle.get_model().to(device).eval()
+    if not quantized:
+        return model
+    start = time.perf_counter()
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    print(f"Quantized Linear layers to int8 in {time.perf_counter() - start:.2f}s")
+    try:
+        torch.save(model, QUANTIZED_MODEL_PATH)
+        print(f"Cached int8 model at {QUANTIZED_MODEL_PATH}")
+    except Exception as e:
+        print(f"Failed to cache int8 model: {e}")
+    return model
+
+# Function to benchmark int8 against float32: emission time and word-boundary drift on the fixture clips
+def run_quantization_benchmark(bundle, device, executor):
+    sample_rate = bundle.sample_rate
+    frames_per_second = sample_rate / FRAME_STRIDE
+    dictionary = {c: i for i, c in enumerate(bundle.get_labels())}
+    models = {"float32": load_model(bundle, device), "int8": load_model(bundle, device, quantized=True)}
+    emission_seconds = {name: 0.0 for name in models}
+    audio_seconds = 0.0
+    drift_ms = []
+
+    for filename, waveform, regions in load_benchmark_fixtures(sample_rate):
+        audio_seconds += waveform.size(1) / sample_rate
+
+        boundaries = {}
+        for name, model in models.items():
+            start = time.perf_counter()
+            emission, _ = compute_emission(model, waveform, sample_rate, device)
+            elapsed = time.perf_counter() - start
+            emission_seconds[name] += elapsed
+            word_segments, _ = align_transcript(executor, emission, regions, dictionary, frames_per_second)
+            seconds_per_frame = waveform.size(1) / emission.size(0) / sample_rate
+            boundaries[name] = np.concatenate((word_segments.start, word_segments.end)) * seconds_per_frame
+            print(f"{filename}: {name} emissions in {elapsed:.2f}s")
+        file_drift = np.abs(boundaries["int8"] - boundaries["float32"]) * 1000
+        drift_ms.append(file_drift)
+        print(f"{filename}: word-boundary drift mean {file_drift.mean():.1f} ms, max {file_drift.max():.1f} ms")
+
+    if not drift_ms:
+        print(f"No benchmark fixtures found in {BENCHMARK_FOLDER}")
+        return
+    fixture_count = len(drift_ms)
+    drift_ms = np.concatenate(drift_ms)
+    print(f"\nBenchmark over {fixture_count} fixtures, {audio_seconds:.1f}s of audio:")
+    for name, seconds in emission_seconds.items():
+        print(f"  {name}: emissions in {seconds:.2f}s ({audio_seconds / seconds:.1f}x realtime)")
+    print(f"  int8 speedup: {emission_seconds['float32'] / emission_seconds['int8']:.2f}x")
+    print(f"  Word-boundary drift: mean {drift_ms.mean():.1f} ms, 95th percentile {np.percentile(drift_ms, 95):.1f} ms, max {drift_ms.max():.1f} ms")
+
+# Function to load the benchmark fixtures as (filename, waveform, regions), skipping unreadable ones
+def load_benchmark_fixtures(sample_rate, max_seconds=None):
+    fixtures = []
+    for filename in sorted(f for f in os.listdir(BENCHMARK_FOLDER) if f.lower().endswith((".mp3", ".wav"))):
+        txt_path = os.path.join(BENCHMARK_FOLDER, os.path.splitext(filename)[0] + ".txt")
+        if not os.path.exists(txt_path):
+            continue
+        try:
+            with open(txt_path, "r", encoding="utf-8") as f:
+                regions = split_regions(f.read().strip())
+            audio, _ = decode_audio(os.path.join(BENCHMARK_FOLDER, filename), sample_rate)
+        except Exception as e:
+            print(f"Skipping fixture {filename}: {e}")
+            continue
+        if not regions or (max_seconds is not None and len(audio) > max_seconds * sample_rate):
+            continue
+        fixtures.append((filename, torch.from_numpy(audio).unsqueeze(0), regions))
+    return fixtures
+
+# Function to benchmark batched against single-clip emissions: log-probability difference and word-boundary drift
+# Fixtures are batched exactly as in a run (plan_batches); each is compared with one unpadded pass over the clip
+def run_batching_benchmark(bundle, device, executor):
+    sample_rate = bundle.sample_rate
+    frames_per_second = sample_rate / FRAME_STRIDE
+    dictionary = {c: i for i, c in enumerate(bundle.get_labels())}
+    model = load_model(bundle, device, quantized=USE_QUANTIZED_MODEL)
+    fixtures = load_benchmark_fixtures(sample_rate, BATCH_MAX_SECONDS)
+    if not fixtures:
+        print(f"No benchmark fixtures up to {BATCH_MAX_SECONDS}s found in {BENCHMARK_FOLDER}")
+        return
+
+    batches = plan_batches([waveform.size(1) for _, waveform, _ in fixtures])
+    batched = [None] * len(fixtures)
+    for batch in batches:
+        for i, emission in zip(batch, compute_emissions_batched(model, [fixtures[i][1] for i in batch], device)):
+            batched[i] = emission
+    print(f"Ran {len(fixtures)} fixtures in {len(batches)} batches (sizes {[len(batch) for batch in batches]})")
+
+    drift_ms = []
+    for (filename, waveform, regions), batched_emission in zip(fixtures, batched):
+        with torch.inference_mode():
+            single_emission, _ = model(waveform.to(device))
+            single_emission = torch.log_softmax(single_emission[0], dim=-1).cpu()
+        if batched_emission.size(0) != single_emission.size(0):
+            print(f"{filename}: frame count differs, batched {batched_emission.size(0)} vs single {single_emission.size(0)}")
+            continue
+        logprob_diff = float((batched_emission - single_emission).abs().max())
+        seconds_per_frame = waveform.size(1) / single_emission.size(0) / sample_rate
+        boundaries = []
+        for emission in (single_emission, batched_emission):
+            word_segments, _ = align_transcript(executor, emission, regions, dictionary, frames_per_second)
+            boundaries.append(np.concatenate((word_segments.start, word_segments.end)) * seconds_per_frame)
+        file_drift = np.abs(boundaries[1] - boundaries[0]) * 1000
+        drift_ms.append(file_drift)
+        print(f"{filename}: max log-probability difference {logprob_diff:.4f}, word-boundary drift mean {file_drift.mean():.1f} ms, max {file_drift.max():.1f} ms")
+
+    if not drift_ms:
+        return
+    fixture_count = len(drift_ms)
+    drift_ms = np.concatenate(drift_ms)
+    print(f"\nBatched vs single-clip emissions over {fixture_count} fixtures:")
+    print(f"  Word-boundary drift: mean {drift_ms.mean():.1f} ms, 95th percentile {np.percentile(drift_ms, 95):.1f} ms, max {drift_ms.max():.1f} ms")
+    print(f"  Set USE_BATCHED_EMISSIONS = False if this drift is too large for your captions")
+
+# Function to hash a file's bytes in blocks
+def get_file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to get the settings that change an alignment (part of the cache key)
+def alignment_params():
+    return {
+        "bundle": BUNDLE_NAME, "quantized": USE_QUANTIZED_MODEL, "region_words": REGION_WORDS,
+        "batched": USE_BATCHED_EMISSIONS, "batch_max_seconds": BATCH_MAX_SECONDS,
+        "window_seconds": EMISSION_WINDOW_SECONDS, "context_seconds": EMISSION_CONTEXT_SECONDS,
+    }
+
+# Function to build the alignment cache key from the audio hash, transcript hash and model settings
+def get_cache_key(audio_hash, transcript_hash, params):
+    payload = json.dumps({"audio": audio_hash, "transcript": transcript_hash, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+# Function to list cache entries as (last_used, size, path), least recently used first
+def list_cache_entries():
+    entries = []
+    if not os.path.isdir(ALIGNMENT_CACHE_FOLDER):
+        return entries
+    for name in os.listdir(ALIGNMENT_CACHE_FOLDER):
+        if name.endswith(".json"):
+            path = os.path.join(ALIGNMENT_CACHE_FOLDER, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    return entries
+
+# Function to evict least recently used cache entries until the cache fits in max_mb
+def prune_cache(max_mb):
+    entries = list_cache_entries()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_mb * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError as e:
+            print(f"Failed to remove cache entry {path}: {e}")
+
+# Function to load a cached alignment as (word segments, ratio), or None on a miss
+def load_cached_alignment(key):
+    path = os.path.join(ALIGNMENT_CACHE_FOLDER, key + ".json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)  # Mark as recently used
+        word_segments = Segments(entry["labels"], np.array(entry["start"], dtype=np.int64),
+                                 np.array(entry["end"], dtype=np.int64), np.array(entry["score"]))
+        return word_segments, entry["ratio"]
+    except (OSError, json.JSONDecodeError, KeyError):
+        return None
+
+# Function to store an alignment in the cache and enforce the size limit
+def save_cached_alignment(key, word_segments, ratio):
+    try:
+        os.makedirs(ALIGNMENT_CACHE_FOLDER, exist_ok=True)
+        path = os.path.join(ALIGNMENT_CACHE_FOLDER, key + ".json")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "params": alignment_params(), "labels": word_segments.labels, "start": word_segments.start.tolist(),
+                "end": word_segments.end.tolist(), "score": word_segments.score.tolist(), "ratio": ratio,
+            }, f)
+        os.replace(temp_path, path)
+        prune_cache(ALIGNMENT_CACHE_MAX_MB)
+    except OSError as e:
+        print(f"Failed to write alignment cache: {e}")
+
+# Function to decode audio to mono float32 at the model sample rate with one FFmpeg process
+# The decode doubles as the integrity check: a failed decode raises with FFmpeg's own error output
+def decode_audio(path, sample_rate, block_bytes=1 << 20):
+    command = ["ffmpeg", "-v", "error", "-nostdin", "-i", path, "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "-"]
+    buffer = bytearray()
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+        while True:
+            block = process.stdout.read(block_bytes)
+            if not block:
+                break
+            buffer += block
+        process.stdout.close()
+        returncode = process.wait()
+        stderr_file.seek(0)
+        errors = stderr_file.read().decode("utf-8", errors="replace").strip()
+    if returncode != 0:
+        raise RuntimeError(f"FFmpeg exited with code {returncode}: {errors}")
+    if not buffer:
+        raise RuntimeError(f"FFmpeg decoded no audio: {errors}")
+    return np.frombuffer(buffer, dtype=np.float32), errors
 
 # Function to format time for ASS
 def format_ass_time(t: float) -> str:
@@ -166,34 +593,18 @@ def get_memory_usage():
     mem_info = process.memory_info()
     return mem_info.rss / 1024 / 1024  # Convert to MB
 
-# Process each video
-print("Scanning video folder for .mp4 files...")
-device = torch.device("cpu")  # Force CPU
-print(f"Using device: {device}")
-try:
-    bundle = torchaudio.pipelines.WAV2VEC2_ASR_BASE_960H
-    model = bundle.get_model().to(device)
-    labels = bundle.get_labels()
-    sample_rate = bundle.sample_rate
-    print(f"Loaded WAV2VEC2 model successfully, memory usage: {get_memory_usage():.2f} MB")
-except Exception as e:
-    print(f"Failed to load WAV2VEC2 model: {e}")
-    exit(1)
-
-video_files = [f for f in os.listdir(VIDEO_FOLDER) if f.endswith(".mp4")]
-print(f"Found {len(video_files)} .mp4 files: {video_files}")
-
-for filename in video_files:
+# Function to check a video's inputs, read its transcript and decode its audio
+# Returns the job for the later stages, or None when the video has to be skipped
+def prepare_video(filename, dictionary, sample_rate):
     base_name = os.path.splitext(filename)[0]
     print(f"\nProcessing {base_name}...")
-    
+
     txt_path = os.path.join(TEST_FOLDER, f"{base_name}.txt")
     audio_path = os.path.join(AUDIO_FOLDER, f"{base_name}.mp3")
     video_path = os.path.join(VIDEO_FOLDER, filename)
     ass_path = os.path.join(OUTPUT_FOLDER, f"{base_name}.ass")
-    temp_video_path = os.path.join(OUTPUT_FOLDER, f"{base_name}_temp.mp4")
     output_path = os.path.join(OUTPUT_FOLDER, f"{base_name}_captioned.mp4")
-    
+
     # Check file existence
     files_exist = {
         "video": os.path.exists(video_path),
@@ -201,138 +612,129 @@ for filename in video_files:
         "text": os.path.exists(txt_path)
     }
     print(f"File check for {base_name}: Video={files_exist['video']}, Audio={files_exist['audio']}, Text={files_exist['text']}")
-    
+
     if not all(files_exist.values()):
         print(f"Skipping {base_name} due to missing files.")
-        continue
-    
-    # Read and clean text
+        return None
+
+    # Read and clean text, split into sentence regions
     try:
         with open(txt_path, "r", encoding="utf-8") as f:
-            text = clean_text(f.read().strip())
+            regions = split_regions(f.read().strip())
     except Exception as e:
         print(f"Failed to read text file {txt_path}: {e}")
-        continue
-    
-    if not text:
+        return None
+
+    words_original = [word for region in regions for word in region]
+    if not words_original:
         print(f"No valid text after cleaning for {base_name}, skipping.")
-        continue
-    words_original = text.split()
-    print(f"Cleaned text for {base_name}: {text[:100]}... ({len(words_original)} words)")
-    
-    # Limit transcript for testing
-    if len(words_original) > 100:
-        print(f"Warning: Transcript has {len(words_original)} words, truncating to 100 for testing.")
-        words_original = words_original[:100]
-        text = " ".join(words_original)
-    
+        return None
+    text = " ".join(words_original)
+    print(f"Cleaned text for {base_name}: {text[:100]}... ({len(words_original)} words in {len(regions)} regions)")
+
     # Prepare transcript for alignment
     transcript = "|" + "|".join(word.upper() for word in words_original) + "|"
-    dictionary = {c: i for i, c in enumerate(labels)}
-    
+
     # Validate transcript characters
     try:
         tokens = [dictionary[c] for c in transcript]
         print(f"Generated tokens for {base_name}, token count: {len(tokens)}")
     except KeyError as e:
         print(f"Invalid character {e} in transcript for {base_name}, skipping.")
-        continue
-    
-    # Load and validate audio
-    try:
-        waveform, audio_sr = torchaudio.load(audio_path)
-        duration = waveform.size(1) / audio_sr
-        print(f"Loaded audio {audio_path}, sample rate: {audio_sr}, duration: {duration:.2f} seconds, memory usage: {get_memory_usage():.2f} MB")
-        if duration > 600:
-            print(f"Warning: Audio duration ({duration:.2f}s) is long, may cause memory issues.")
-    except Exception as e:
-        print(f"Failed to load audio {audio_path}: {e}")
-        continue
-    
-    # Validate waveform
+        return None
+
+    job = {
+        "base_name": base_name, "audio_path": audio_path, "video_path": video_path, "ass_path": ass_path,
+        "output_path": output_path, "regions": regions, "words_original": words_original, "waveform": None,
+        "cache_key": None, "cached": None,
+    }
+
+    # Look up a cached alignment for this audio file and cleaned transcript
+    if USE_ALIGNMENT_CACHE:
+        try:
+            transcript_hash = hashlib.sha256("\n".join(" ".join(region) for region in regions).encode("utf-8")).hexdigest()
+            job["cache_key"] = get_cache_key(get_file_hash(audio_path), transcript_hash, alignment_params())
+            job["cached"] = load_cached_alignment(job["cache_key"])
+        except OSError as e:
+            print(f"Failed to hash {audio_path} for the alignment cache: {e}")
+        if job["cached"] is not None:
+            print(f"Using cached alignment for {base_name}, skipping audio decode and model")
+            return job
+
+    # Decode audio to mono at the model sample rate (also validates the file)
     try:
-        print(f"Waveform shape: {waveform.shape}, dtype: {waveform.dtype}")
-        if waveform.ndim != 2 or waveform.shape[0] not in [1, 2]:
-            raise ValueError("Waveform must be 1D or 2D with 1 or 2 channels")
-        if waveform.shape[0] == 2:
-            waveform = waveform.mean(dim=0, keepdim=True)  # Convert stereo to mono
-        print(f"Processed waveform shape: {waveform.shape}")
+        audio, decode_errors = decode_audio(audio_path, sample_rate)
+        if decode_errors:
+            print(f"FFmpeg reported errors while decoding {audio_path}: {decode_errors}")
+        waveform = torch.from_numpy(audio).unsqueeze(0)
+        duration = waveform.size(1) / sample_rate
+        print(f"Decoded audio {audio_path} to {sample_rate} Hz mono, duration: {duration:.2f} seconds, memory usage: {get_memory_usage():.2f} MB")
+        if uses_batched_emissions(waveform.size(1), sample_rate):
+            print("Emissions will be computed in one batched pass with other clips of similar length.")
+        elif uses_emission_windows(waveform.size(1), sample_rate):
+            print(f"Emissions will be computed on their own in {EMISSION_WINDOW_SECONDS}s windows.")
+        else:
+            print("Emissions will be computed on their own in one pass.")
     except Exception as e:
-        print(f"Waveform validation failed for {base_name}: {e}")
-        continue
-    
-    # Validate audio integrity with FFmpeg
-    try:
-        ffmpeg_check = subprocess.run(
-            ["ffmpeg", "-i", audio_path, "-f", "null", "-"],
-            capture_output=True, text=True, check=True
-        )
-        print(f"FFmpeg validated audio file {audio_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"FFmpeg audio validation failed for {base_name}: {e.stderr}")
-        continue
-    
-    if audio_sr != sample_rate:
-        try:
-            waveform = torchaudio.functional.resample(waveform, audio_sr, sample_rate)
-            print(f"Resampled audio to {sample_rate} Hz, memory usage: {get_memory_usage():.2f} MB")
-        except Exception as e:
-            print(f"Failed to resample audio for {base_name}: {e}")
-            continue
-    
-    # Get emissions
-    with torch.inference_mode():
-        try:
-            print(f"Processing model, memory usage before: {get_memory_usage():.2f} MB")
-            emissions, _ = model(waveform.to(device))
-            emissions = torch.log_softmax(emissions, dim=-1)
-            print(f"Generated emissions for {base_name}, emissions shape: {emissions.shape}, memory usage after: {get_memory_usage():.2f} MB")
-        except MemoryError as e:
-            print(f"MemoryError during model processing for {base_name}: {e}")
-            continue
-        except RuntimeError as e:
-            print(f"RuntimeError during model processing for {base_name}: {e}")
-            continue
-        except Exception as e:
-            print(f"Unexpected error during model processing for {base_name}: {e}")
-            continue
-    emission = emissions[0].cpu().detach()
-    
-    # Get trellis, path, segments
+        print(f"Failed to decode audio {audio_path}: {e}")
+        return None
+
+    job["waveform"] = waveform
+    return job
+
+# Function to align a decoded video's transcript against its emissions, cache the result and render
+def finish_video(job, emission, executor, dictionary, sample_rate):
+    base_name = job["base_name"]
+    regions, words_original, waveform = job["regions"], job["words_original"], job["waveform"]
+
+    # Align: one trellis for short transcripts, region by region for long ones
     try:
         print(f"Starting alignment, memory usage: {get_memory_usage():.2f} MB")
-        trellis = get_trellis(emission, tokens)
-        path = backtrack(trellis, emission, tokens)
-        segments = merge_repeats(path, transcript)
-        word_segments = merge_words(segments)
-        print(f"Aligned {len(word_segments)} words for {base_name}")
+        align_start = time.perf_counter()
+        word_segments, region_scores = align_transcript(executor, emission, regions, dictionary, sample_rate / FRAME_STRIDE)
+        print(f"Aligned {len(word_segments)} words in {len(regions)} regions for {base_name} in {time.perf_counter() - align_start:.2f}s, memory usage: {get_memory_usage():.2f} MB")
+        for i, score in enumerate(region_scores):
+            if score < REGION_MIN_CONFIDENCE:
+                print(f"Warning: low alignment confidence {score:.2f} in region {i + 1} ('{' '.join(regions[i][:6])}...')")
+        print(f"Region confidence for {base_name}: min {min(region_scores):.2f}, mean {np.mean(region_scores):.2f}")
     except Exception as e:
         print(f"Alignment failed for {base_name}: {e}")
-        continue
-    
+        return False
+
     # Calculate ratio for timestamps
-    ratio = waveform.size(1) / trellis.size(0)
-    
+    ratio = waveform.size(1) / emission.size(0)
+
     # Update word_segments with original casing
-    for i, seg in enumerate(word_segments):
-        seg.label = words_original[i] if i < len(words_original) else seg.label
-    
+    word_segments.labels = [words_original[i] if i < len(words_original) else label
+                            for i, label in enumerate(word_segments.labels)]
+    if job["cache_key"]:
+        save_cached_alignment(job["cache_key"], word_segments, ratio)
+
+    return render_video(job, word_segments, ratio, sample_rate)
+
+# Function to write the ASS file for aligned words and render the captioned video
+def render_video(job, word_segments, ratio, sample_rate):
+    base_name, audio_path, video_path = job["base_name"], job["audio_path"], job["video_path"]
+    ass_path, output_path = job["ass_path"], job["output_path"]
+
     # Generate ASS file with word highlighting
     try:
         with open(ass_path, "w", encoding="utf-8") as f:
             f.write(ASS_HEADER)
             chunk_size = 5
             for i in range(0, len(word_segments), chunk_size):
-                chunk = word_segments[i:i + chunk_size]
-                if not chunk:
+                chunk_labels = word_segments.labels[i:i + chunk_size]
+                chunk_starts = word_segments.start[i:i + chunk_size]
+                chunk_ends = word_segments.end[i:i + chunk_size]
+                if not chunk_labels:
                     continue
-                start_time = (chunk[0].start * ratio) / sample_rate
-                end_time = (chunk[-1].end * ratio) / sample_rate
+                start_time = (chunk_starts[0] * ratio) / sample_rate
+                end_time = (chunk_ends[-1] * ratio) / sample_rate
                 ass_text = ""
                 current_time = start_time * 100  # Centiseconds
-                for seg in chunk:
-                    dur_cs = int(((seg.end - seg.start) * ratio / sample_rate) * 100)
-                    ass_text += r"{\t(" + str(int(current_time - start_time * 100)) + "," + str(int(current_time - start_time * 100 + dur_cs)) + ",,Highlight)}" + seg.label + r"{\t(" + str(int(current_time - start_time * 100 + dur_cs)) + "," + str(int(current_time - start_time * 100 + dur_cs + 10)) + ",,Default)}" + " "
+                for label, seg_start, seg_end in zip(chunk_labels, chunk_starts, chunk_ends):
+                    dur_cs = int(((seg_end - seg_start) * ratio / sample_rate) * 100)
+                    ass_text += r"{\t(" + str(int(current_time - start_time * 100)) + "," + str(int(current_time - start_time * 100 + dur_cs)) + ",,Highlight)}" + label + r"{\t(" + str(int(current_time - start_time * 100 + dur_cs)) + "," + str(int(current_time - start_time * 100 + dur_cs + 10)) + ",,Default)}" + " "
                     current_time += dur_cs
                 ass_text = ass_text.strip()
                 start_ass = format_ass_time(start_time)
@@ -341,52 +743,182 @@ for filename in video_files:
         print(f"Generated ASS file: {ass_path}")
     except Exception as e:
         print(f"Failed to generate ASS file for {base_name}: {e}")
-        continue
-    
-    # Combine video and audio using ffmpeg
-    combine_cmd = [
+        return False
+
+    # Mux the MP4 video with the MP3 audio and burn the subtitles in a single FFmpeg pass
+    ass_path_escaped = ass_path.replace('\\', '\\\\').replace(':', '\\:')
+    render_cmd = [
         "ffmpeg",
+        "-nostdin",
         "-i", video_path,
         "-i", audio_path,
-        "-c:v", "copy",
+        "-map", "0:v:0",
+        "-map", "1:a:0",
+        "-vf", f"ass={ass_path_escaped}",
+        "-c:v", "libx264",
         "-c:a", "aac",
-        "-strict", "experimental",
-        temp_video_path
+        "-y", output_path
     ]
     try:
-        print(f"Running FFmpeg combine command: {' '.join(combine_cmd)}")
-        result = subprocess.run(combine_cmd, check=True, capture_output=True, text=True)
-        print(f"Combined video and audio: {temp_video_path}")
+        print(f"Running FFmpeg render command: {' '.join(render_cmd)}")
+        result = subprocess.run(render_cmd, check=True, capture_output=True, text=True)
+        print(f"Added subtitles, output: {output_path}")
     except subprocess.CalledProcessError as e:
-        print(f"FFmpeg failed to combine video and audio for {base_name}: {e.stderr}")
-        continue
-# Add subtitles using ffmpeg with escaped path
-ass_path_escaped = ass_path.replace('\\', '\\\\').replace(':', '\\:')
-subtitle_cmd = [
-    "ffmpeg",
-    "-i", temp_video_path,
-    "-vf", f"ass={ass_path_escaped}",
-    "-c:v", "libx264",
-    "-c:a", "copy",
-    output_path
-]
-try:
-    print(f"Running FFmpeg subtitle command: {' '.join(subtitle_cmd)}")
-    result = subprocess.run(subtitle_cmd, check=True, capture_output=True, text=True)
-    print(f"Added subtitles, output: {output_path}")
-except subprocess.CalledProcessError as e:
-    print(f"FFmpeg failed to add subtitles for {base_name}: {e.stderr}")
-    # Remove temporary files to avoid clutter
-    
-    
-    # Clean up temp files
+        print(f"FFmpeg failed to render {base_name}, keeping {ass_path} for inspection: {e.stderr}")
+        return False
+
+    # Clean up the ASS file
     try:
-        os.remove(temp_video_path)
         os.remove(ass_path)
         print(f"Cleaned up temporary files for {base_name}")
     except OSError as e:
         print(f"Failed to clean up temporary files for {base_name}: {e}")
-    
+
     print(f"Successfully processed {base_name}")
+    return True
+
+# Function to estimate the activation memory of one forward pass in MB
+# Dominated by the first conv layer (512 channels at 1/5 of the sample rate) and the attention maps
+def estimate_batch_memory_mb(batch_size, num_samples):
+    frames = num_samples / FRAME_STRIDE
+    per_clip = num_samples / 5 * 512 * 4 + frames * frames * 12 * 4 + frames * 768 * 4 * 8
+    return batch_size * per_clip / 1024 / 1024
+
+# Function to group clips into batches of similar length, bounded in size and estimated memory
+def plan_batches(lengths):
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    batch = []
+    for i in order:
+        # Sorted by length, so the new clip is the longest and sets the padded length
+        if batch and (
+            len(batch) >= MAX_BATCH_SIZE
+            or lengths[i] > lengths[batch[0]] * BATCH_LENGTH_SPREAD
+            or estimate_batch_memory_mb(len(batch) + 1, lengths[i]) > MAX_BATCH_MEMORY_MB
+        ):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+# Function to compute emissions for a batch of short waveforms with one encoder pass
+# The convolutional feature extractor normalizes over the whole time axis, so it runs on each clip unpadded;
+# the features are then padded and the encoder zeroes and masks the padded frames, which leaves each clip's
+# emissions the same as a single unpadded pass (up to float rounding). Each is sliced back to its frame count
+def compute_emissions_batched(model, waveforms, device):
+    with torch.inference_mode():
+        features = [model.feature_extractor(waveform.to(device), None)[0][0] for waveform in waveforms]
+        frame_lengths = torch.tensor([feature.size(0) for feature in features], device=device)
+        padded = torch.nn.utils.rnn.pad_sequence(features, batch_first=True)
+        emissions = model.encoder(padded, frame_lengths)
+        if model.aux is not None:
+            emissions = model.aux(emissions)
+        emissions = torch.log_softmax(emissions, dim=-1).cpu()
+    return [emissions[row, :int(frame_lengths[row])].clone() for row in range(len(waveforms))]
+
+# Function to compute one job's emissions on its own (windowed when long); returns None on failure
+def get_job_emission(model, job, sample_rate, device):
+    base_name = job["base_name"]
+    try:
+        print(f"Processing model, memory usage before: {get_memory_usage():.2f} MB")
+        emission_start = time.perf_counter()
+        emission, peak_memory = compute_emission(model, job["waveform"], sample_rate, device)
+        print(f"Generated emissions for {base_name} in {time.perf_counter() - emission_start:.2f}s, emissions shape: {tuple(emission.shape)}, peak memory usage: {peak_memory:.2f} MB")
+        return emission
+    except MemoryError as e:
+        print(f"MemoryError during model processing for {base_name}: {e}")
+    except RuntimeError as e:
+        print(f"RuntimeError during model processing for {base_name}: {e}")
+    except Exception as e:
+        print(f"Unexpected error during model processing for {base_name}: {e}")
+    return None
+
+# Function to run the queued short clips through the model in batches, then align and render each
+def process_batch(jobs, model, executor, dictionary, sample_rate, device):
+    batches = plan_batches([job["waveform"].size(1) for job in jobs])
+    audio_seconds = sum(job["waveform"].size(1) for job in jobs) / sample_rate
+    print(f"\nRunning {len(jobs)} clips ({audio_seconds:.1f}s of audio) through the model in {len(batches)} batches")
+    start = time.perf_counter()
+    emissions = [None] * len(jobs)
+    for batch in batches:
+        try:
+            results = compute_emissions_batched(model, [jobs[i]["waveform"] for i in batch], device)
+            for i, emission in zip(batch, results):
+                emissions[i] = emission
+        except (MemoryError, RuntimeError) as e:
+            print(f"Batched model processing failed ({e}), falling back to one clip at a time")
+            for i in batch:
+                emissions[i] = get_job_emission(model, jobs[i], sample_rate, device)
+    elapsed = time.perf_counter() - start
+    print(f"Generated emissions for {len(jobs)} clips in {elapsed:.2f}s ({len(jobs) / elapsed:.2f} clips/s), memory usage: {get_memory_usage():.2f} MB")
+    for job, emission in zip(jobs, emissions):
+        if emission is not None:
+            print(f"\nFinishing {job['base_name']}...")
+            finish_video(job, emission, executor, dictionary, sample_rate)
+# Main processing loop
+def main():
+    # Verify directories exist
+    print(f"Checking directories:")
+    print(f"  Video folder: {VIDEO_FOLDER} - Exists: {os.path.exists(VIDEO_FOLDER)}")
+    print(f"  Audio folder: {AUDIO_FOLDER} - Exists: {os.path.exists(AUDIO_FOLDER)}")
+    print(f"  Text folder: {TEST_FOLDER} - Exists: {os.path.exists(TEST_FOLDER)}")
+    print(f"  Output folder: {OUTPUT_FOLDER} - Exists: {os.path.exists(OUTPUT_FOLDER)}")
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+
+    # Process each video
+    print("Scanning video folder for .mp4 files...")
+    device = torch.device("cpu")  # Force CPU
+    print(f"Using device: {device}")
+    bundle = getattr(torchaudio.pipelines, BUNDLE_NAME)
+    executor = ProcessPoolExecutor(max_workers=ALIGN_WORKERS, initializer=init_align_worker)
+    if RUN_QUANTIZATION_BENCHMARK:
+        run_quantization_benchmark(bundle, device, executor)
+        executor.shutdown()
+        return
+    if RUN_BATCHING_BENCHMARK:
+        run_batching_benchmark(bundle, device, executor)
+        executor.shutdown()
+        return
+
+    try:
+        model = load_model(bundle, device, quantized=USE_QUANTIZED_MODEL)
+        labels = bundle.get_labels()
+        sample_rate = bundle.sample_rate
+        print(f"Loaded WAV2VEC2 model successfully ({'int8' if USE_QUANTIZED_MODEL else 'float32'}), memory usage: {get_memory_usage():.2f} MB")
+    except Exception as e:
+        print(f"Failed to load WAV2VEC2 model: {e}")
+        exit(1)
+
+    video_files = [f for f in os.listdir(VIDEO_FOLDER) if f.endswith(".mp4")]
+    print(f"Found {len(video_files)} .mp4 files: {video_files}")
+
+    dictionary = {c: i for i, c in enumerate(labels)}
+    pending = []  # Short clips waiting for a batched forward pass
+
+    for filename in video_files:
+        job = prepare_video(filename, dictionary, sample_rate)
+        if job is None:
+            continue
+        if job["cached"] is not None:
+            render_video(job, *job["cached"], sample_rate)
+            continue
+        # Long files go through the windowed path on their own; short clips are batched
+        if not uses_batched_emissions(job["waveform"].size(1), sample_rate):
+            emission = get_job_emission(model, job, sample_rate, device)
+            if emission is not None:
+                finish_video(job, emission, executor, dictionary, sample_rate)
+            continue
+        pending.append(job)
+        if len(pending) >= BATCH_QUEUE_CLIPS:
+            process_batch(pending, model, executor, dictionary, sample_rate, device)
+            pending = []
+    if pending:
+        process_batch(pending, model, executor, dictionary, sample_rate, device)
+
+    executor.shutdown()
+    print("Processing complete.")
 
-print("Processing complete.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
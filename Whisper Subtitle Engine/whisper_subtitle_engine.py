@@ -0,0 +1,1316 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import bisect
+import shutil
+import hashlib
+import argparse
+import difflib
+import threading
+import subprocess
+import tempfile
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+import numpy as np
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SAMPLE_RATE = 16000  # Whisper models take 16 kHz mono float32
+DECODE_BLOCK_BYTES = 1 << 20
+# Only .mp4 inputs are rendered: output and ASS names hash the base name without its extension,
+# so clip.mp4 and clip.mkv would share them, and -c:a copy into .mp4 fails for Opus/Vorbis audio
+VIDEO_EXTENSIONS = ('.mp4',)
+FIXTURE_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.wav', '.mp3', '.m4a', '.flac')
+TELEMETRY_STAGES = ('probe', 'decode', 'model_load', 'transcribe', 'chunking', 'ass_write', 'encode')
+# Stages whose work runs on the model's native thread pools (CTranslate2 / torch) rather than
+# on the calling thread; their CPU time is this process's own, which excludes child processes
+NATIVE_THREAD_STAGES = ('model_load', 'transcribe')
+
+# ASS header shared by every render; the Default style is filled in from the engine config
+ASS_HEADER = """[Script Info]
+Title: Captions
+ScriptType: v4.00+
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+PlayResX: 1280
+PlayResY: 720
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,{font_name},{font_size},&H00FFFFFF,&H00FFFF00,&H00000000,&H00000000,{bold},{italic},0,0,100,100,0,0,1,2,2,5,30,30,30,1
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+@dataclass
+class EngineConfig:
+    """Settings for one engine instance; model, probe and encoder settings are fixed per process."""
+    # Model
+    backend: str = "faster-whisper"
+    model: Optional[str] = None  # None = the backend's default model
+    compute_type: str = "int8"
+    beam_size: int = 5
+    cpu_threads: int = max(1, (os.cpu_count() or 4) // 2)  # Model threads in each transcribing process
+    model_workers: int = 1  # Parallel transcribe() calls one faster-whisper model can serve
+    workers: int = 1  # Transcription processes, each with its own model (1 = transcribe in this process)
+
+    # Voice-activity gating: only speech regions are sent to the model and word timestamps
+    # are mapped back to the original timeline
+    vad: bool = True
+    vad_frame_seconds: float = 0.03
+    vad_threshold_db: float = -35  # Frames quieter than the loudest frame by more than this are silence
+    vad_floor_db: float = -60  # Absolute floor so near-silent files are not treated as speech
+    vad_min_silence_seconds: float = 0.5  # Shorter pauses stay inside a speech region
+    vad_padding_seconds: float = 0.2
+
+    # Timing
+    speed_factor: float = 4
+    title_seconds: float = 1  # Title card length before dividing by speed_factor
+    trim_to_speed_factor: bool = False  # Drop chunks starting after duration / speed_factor
+    clip_audio: bool = True  # When trimming, only decode and transcribe up to the cut plus guard_seconds
+    guard_seconds: float = 2.0
+    max_chunk_words: int = 3
+    min_chunk_duration: float = 0.5  # Minimum display time per chunk
+
+    # Style and encoder
+    font_name: str = "Seagl Print"
+    font_size: int = 70
+    bold: bool = True
+    italic: bool = False
+    preset: str = "fast"
+    crf: int = 23
+    encode_threads: int = max(1, (os.cpu_count() or 4) // 2)  # ffmpeg -threads for the burn-in (0 = auto)
+
+    # Segment-parallel burn-in for long videos: split at keyframes, encode the segments
+    # concurrently and concat them without re-encoding
+    parallel_burn_segments: int = 1  # 1 = always burn in a single ffmpeg process
+    parallel_burn_min_seconds: float = 600  # Shorter videos use the single-process path
+    verify_parallel_burn: bool = True  # Compare output duration and A/V offset with the source
+    parallel_burn_tolerance: float = 0.1  # Seconds
+
+    # Pipeline: video N+1 is transcribed while video N is burned in
+    pipeline_queue_size: int = 2  # Transcribed videos allowed to wait for the encoder
+
+    # Word timing cache (re-renders with a new style or chunking rule skip transcription)
+    cache_dir: Optional[str] = None
+    cache_max_mb: float = 500
+
+    # Incremental mode: videos whose content, parameters, style and output are unchanged
+    # since their last successful render are skipped
+    manifest_path: Optional[str] = None
+
+    # Telemetry: per-stage timings as one JSON line per video plus an end-of-run summary
+    telemetry_path: Optional[str] = None
+    debug: bool = False  # Print every subtitle chunk and the full ASS file
+
+
+class TranscriptionBackend(ABC):
+    """Interface for speech models that return word-level timings."""
+    name = ""
+    default_model = ""
+
+    def __init__(self, config):
+        self.config = config
+        self.model_name = config.model or self.default_model
+
+    @abstractmethod
+    def load(self):
+        """Load the model; called once per process."""
+
+    @abstractmethod
+    def transcribe(self, audio) -> List[Tuple[str, float, float]]:
+        """Return (word, start, end) for 16 kHz mono float32 audio."""
+
+    def cache_params(self):
+        """Settings that change this backend's output (part of the word timing cache key)."""
+        return {'backend': self.name, 'model': self.model_name, 'compute_type': self.config.compute_type,
+                'beam_size': self.config.beam_size}
+
+
+class FasterWhisperBackend(TranscriptionBackend):
+    """faster-whisper (CTranslate2) backend."""
+    name = "faster-whisper"
+    default_model = "small"
+
+    def load(self):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(self.model_name, device="cpu", compute_type=self.config.compute_type,
+                                  cpu_threads=self.config.cpu_threads, num_workers=self.config.model_workers)
+
+    def transcribe(self, audio):
+        # Segments are produced lazily, so decoding happens while the words are collected
+        segments, _ = self.model.transcribe(audio, beam_size=self.config.beam_size, word_timestamps=True)
+        return [(word.word, word.start, word.end) for segment in segments for word in segment.words]
+
+
+class WhisperTimestampedBackend(TranscriptionBackend):
+    """whisper_timestamped (PyTorch) backend."""
+    name = "whisper_timestamped"
+    default_model = "tiny"
+
+    def load(self):
+        import torch
+        import whisper_timestamped
+        torch.set_num_threads(self.config.cpu_threads)
+        self.module = whisper_timestamped
+        self.model = whisper_timestamped.load_model(self.model_name, device="cpu")
+
+    def transcribe(self, audio):
+        result = self.module.transcribe(self.model, audio, beam_size=self.config.beam_size)
+        return [(word["text"], word["start"], word["end"])
+                for segment in result["segments"] for word in segment.get("words", [])
+                if "start" in word and "end" in word and "text" in word]
+
+    def cache_params(self):
+        return {**super().cache_params(), 'compute_type': 'float32'}
+
+
+BACKENDS = {backend.name: backend for backend in (FasterWhisperBackend, WhisperTimestampedBackend)}
+
+
+def format_time(seconds):
+    """Format seconds as an ASS timestamp (H:MM:SS.CC)."""
+    seconds = max(0, seconds)
+    hours = int(seconds / 3600)
+    minutes = int((seconds % 3600) / 60)
+    secs = int(seconds % 60)
+    centiseconds = int((seconds - int(seconds)) * 100)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def parse_ass_time(text):
+    """Parse an ASS timestamp (H:MM:SS.CC) into seconds."""
+    hours, minutes, seconds = text.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def escape_ass_text(text):
+    """Escape override braces and newlines for an ASS Dialogue line."""
+    return text.replace('{', '\\{').replace('}', '\\}').replace('\n', '\\N')
+
+
+def escape_filter_path(path):
+    """Escape a path for use inside a quoted ffmpeg filter option."""
+    return path.replace('\\', '\\\\').replace(':', '\\:').replace(',', '\\,')
+
+
+def get_container_duration(path, usage=None):
+    """Read the container duration with a header-only ffprobe call."""
+    output = run_process(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', path],
+                         usage, capture_stdout=True)
+    return float(json.loads(output)['format']['duration'])
+
+
+def probe_durations(path):
+    """Get the container duration and the first video/audio stream durations."""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-show_entries', 'format=duration:stream=codec_type,duration',
+        '-of', 'json', path
+    ], capture_output=True, text=True, check=True)
+    data = json.loads(result.stdout)
+    streams = {}
+    for stream in data.get('streams', []):
+        if 'duration' in stream:
+            streams.setdefault(stream['codec_type'], float(stream['duration']))
+    return float(data['format']['duration']), streams
+
+
+def decode_audio(path, max_seconds=None, block_bytes=DECODE_BLOCK_BYTES, usage=None):
+    """Decode an audio track to 16 kHz mono float32, reading the ffmpeg pipe in blocks."""
+    command = ['ffmpeg', '-v', 'error', '-nostdin']
+    if max_seconds is not None:
+        command += ['-t', f"{max_seconds:.3f}"]
+    command += ['-i', path, '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 'f32le', '-']
+    buffer = bytearray()
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+        while True:
+            block = process.stdout.read(block_bytes)
+            if not block:
+                break
+            buffer += block
+        process.stdout.close()
+        if wait_for_child(process, usage) != 0:
+            stderr_file.seek(0)
+            error = stderr_file.read().decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {error}")
+    return np.frombuffer(buffer, dtype=np.float32)
+
+
+def detect_speech_regions(audio, threshold_db=-35, min_silence_seconds=0.5, frame_seconds=0.03,
+                          padding_seconds=0.2, floor_db=-60):
+    """Find speech as (start, end) sample ranges with a frame-energy VAD."""
+    frame = int(SAMPLE_RATE * frame_seconds)
+    frame_count = len(audio) // frame
+    if frame_count == 0:
+        return [(0, len(audio))] if len(audio) else []
+    frames = audio[:frame_count * frame].reshape(frame_count, frame)
+    energy_db = 10 * np.log10(np.mean(np.square(frames, dtype=np.float64), axis=1) + 1e-10)
+    voiced = np.flatnonzero(energy_db > max(energy_db.max() + threshold_db, floor_db))
+    if voiced.size == 0:
+        return []
+
+    # Bridge pauses shorter than min_silence_seconds, then pad each region
+    gaps = np.flatnonzero(np.diff(voiced) > min_silence_seconds / frame_seconds)
+    starts = np.concatenate(([voiced[0]], voiced[gaps + 1]))
+    ends = np.concatenate((voiced[gaps], [voiced[-1]])) + 1
+    padding = int(padding_seconds / frame_seconds)
+    regions = []
+    for start, end in zip(starts, ends):
+        start = max(0, int(start - padding) * frame)
+        end = min(len(audio), int(end + padding) * frame)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def gate_audio(audio, regions):
+    """Cut everything outside the speech regions; returns the gated audio and where each region starts in it."""
+    gated_starts = []
+    position = 0
+    for start, end in regions:
+        gated_starts.append(position)
+        position += end - start
+    if not regions:
+        return audio[:0], gated_starts
+    return np.concatenate([audio[start:end] for start, end in regions]), gated_starts
+
+
+def remap_time(seconds, regions, gated_starts, is_end=False):
+    """Map a timestamp in the gated audio back to the original timeline.
+
+    A position exactly on the joint between two regions is the start of the later region
+    but the end of the earlier one, so end times are looked up with bisect_left.
+    """
+    position = seconds * SAMPLE_RATE
+    find = bisect.bisect_left if is_end else bisect.bisect_right
+    i = max(find(gated_starts, position) - 1, 0)
+    return (regions[i][0] + position - gated_starts[i]) / SAMPLE_RATE
+
+
+def build_chunks(words, timings, max_words=3, min_duration=0.5):
+    """Group words into subtitle chunks of up to max_words or min_duration seconds."""
+    chunks = []
+    chunk_timings = []
+    current_chunk = []
+    current_start = None
+    for word, (start, end) in zip(words, timings):
+        if not current_chunk:
+            current_start = start
+        current_chunk.append(word)
+        if len(current_chunk) >= max_words or end - current_start >= min_duration:
+            chunks.append(current_chunk)
+            chunk_timings.append((current_start, end))
+            current_chunk = []
+            current_start = None
+    if current_chunk:
+        chunks.append(current_chunk)
+        chunk_timings.append((current_start, timings[-1][1]))
+    return chunks, chunk_timings
+
+
+def write_segment_ass(ass_path, segment_ass, segment_start, segment_end):
+    """Write a copy of an ASS file with its events shifted into a segment's local time."""
+    with open(ass_path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    with open(segment_ass, 'w', encoding='utf-8') as f:
+        for line in lines:
+            if line.startswith('Dialogue:'):
+                layer, start, end, rest = line.split(',', 3)
+                start, end = parse_ass_time(start), parse_ass_time(end)
+                if end <= segment_start or start >= segment_end:
+                    continue
+                line = f"{layer},{format_time(start - segment_start)},{format_time(end - segment_start)},{rest}"
+            f.write(line + '\n')
+
+
+def get_file_hash(path):
+    """Hash a file's contents in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_cache_key(audio, params):
+    """Word timing cache key: the decoded audio's hash plus the transcription settings."""
+    payload = json.dumps({'audio': hashlib.sha256(audio).hexdigest(), **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def list_cache_entries(cache_dir):
+    """List cache entries as (last_used, size, path), least recently used first."""
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+    for name in os.listdir(cache_dir):
+        if name.endswith('.json'):
+            path = os.path.join(cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    return entries
+
+
+def prune_cache(cache_dir, max_mb):
+    """Evict least recently used cache entries until the cache fits in max_mb; returns the number removed."""
+    entries = list_cache_entries(cache_dir)
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if total <= max_mb * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError as e:
+            print(f"Error removing cache entry {path}: {e}")
+    return removed
+
+
+def print_cache_info(cache_dir, max_mb):
+    """Print the cache contents, most recently used first."""
+    entries = list_cache_entries(cache_dir)
+    total = sum(size for _, size, _ in entries)
+    print(f"Word timing cache: {cache_dir}")
+    print(f"{len(entries)} entries, {total / 1024 / 1024:.2f} MB (limit {max_mb} MB)")
+    for last_used, size, path in reversed(entries):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            params = entry.get('params', {})
+            summary = ', '.join(f"{k}={v}" for k, v in sorted(params.items()))
+            word_count = len(entry.get('words', []))
+        except (OSError, json.JSONDecodeError) as e:
+            summary, word_count = f"unreadable ({e})", 0
+        used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_used))
+        print(f"  {os.path.basename(path)[:16]}  {used}  {size / 1024:8.1f} KB  {word_count:6d} words  {summary}")
+
+
+def load_cached_words(cache_dir, key):
+    """Load cached words and timings, marking the entry as recently used; None on a miss."""
+    path = os.path.join(cache_dir, key + '.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        os.utime(path)
+        return entry['words'], [tuple(timing) for timing in entry['timings']]
+    except (OSError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def save_cached_words(cache_dir, max_mb, key, params, words, timings):
+    """Store words and timings atomically and enforce the cache size limit."""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, key + '.json')
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'words': words, 'timings': timings}, f)
+        os.replace(temp_path, path)
+        prune_cache(cache_dir, max_mb)
+    except OSError as e:
+        print(f"Error writing word timing cache: {e}")
+
+
+class JobManifest:
+    """Input file -> state of its last successful render, kept in a JSON file that is written atomically."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading manifest {self.path}, starting a new one: {e}")
+            return {}
+
+    def get(self, video_file):
+        return self.entries.get(video_file)
+
+    def record(self, video_file, state):
+        """Record a finished video and rewrite the manifest."""
+        with self.lock:
+            self.entries[video_file] = state
+            temp_path = f"{self.path}.tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.entries, f, indent=1)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"Error writing manifest {self.path}: {e}")
+
+
+def is_up_to_date(entry, state):
+    """Check whether a video's last render used exactly the same inputs."""
+    if not entry or not os.path.exists(state['output']):
+        return False
+    return all(entry.get(key) == state[key] for key in ('hash', 'params', 'style', 'output'))
+
+
+_usage_lock = threading.Lock()
+
+
+def add_child_usage(usage, cpu_seconds, peak_rss_mb):
+    """Add one finished child process to a stage's usage dict (None values mean unmeasured)."""
+    with _usage_lock:
+        usage['children'] = usage.get('children', 0) + 1
+        if cpu_seconds is None:
+            usage['unmeasured'] = True
+        else:
+            usage['cpu_s'] = usage.get('cpu_s', 0.0) + cpu_seconds
+        if peak_rss_mb is not None:
+            usage['peak_rss_mb'] = max(usage.get('peak_rss_mb', 0.0), peak_rss_mb)
+
+
+def wait_for_child(process, usage=None):
+    """Wait for a child process and return its exit code.
+
+    When usage (a dict) is given, the child's own CPU seconds and peak RSS are added to it:
+    from os.wait4 where available, otherwise by sampling the child with psutil until it exits.
+    """
+    if usage is None:
+        return process.wait()
+    if hasattr(os, 'wait4'):
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        peak = rusage.ru_maxrss / 1024 / 1024 if sys.platform == 'darwin' else rusage.ru_maxrss / 1024
+        add_child_usage(usage, rusage.ru_utime + rusage.ru_stime, peak)
+        return process.returncode
+
+    cpu_seconds = None
+    peak = None
+    if psutil is not None:
+        try:
+            child = psutil.Process(process.pid)
+            while True:
+                times = child.cpu_times()
+                cpu_seconds = times.user + times.system
+                peak = max(peak or 0.0, child.memory_info().rss / 1024 / 1024)
+                try:
+                    process.wait(timeout=0.2)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+        except psutil.Error:
+            pass
+    process.wait()
+    add_child_usage(usage, cpu_seconds, peak)
+    return process.returncode
+
+
+def run_process(command, usage=None, capture_stdout=False):
+    """Run a command to completion, adding its resource usage to usage; raises CalledProcessError on failure.
+
+    Returns the decoded stdout when capture_stdout is set.
+    """
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stderr=stderr_file,
+                                   stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL)
+        output = process.stdout.read() if capture_stdout else b''
+        if capture_stdout:
+            process.stdout.close()
+        if wait_for_child(process, usage) != 0:
+            stderr_file.seek(0)
+            raise subprocess.CalledProcessError(process.returncode, command, output,
+                                                stderr_file.read().decode('utf-8', errors='replace'))
+    return output.decode('utf-8', errors='replace')
+
+
+def get_process_cpu_seconds():
+    """CPU seconds used by this process's own threads (child processes excluded)."""
+    times = os.times()
+    return times.user + times.system
+
+
+def get_process_peak_rss_mb():
+    """This process's peak resident memory over its whole lifetime so far, in MB."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 / 1024
+    return None
+
+
+def start_stage():
+    """Snapshot the wall, calling-thread CPU and process CPU clocks at the start of a stage."""
+    return time.perf_counter(), time.thread_time(), get_process_cpu_seconds()
+
+
+def end_stage(record, stage, started, audio_seconds=None, usage=None):
+    """Record a finished stage's wall time, CPU time, memory and throughput; returns the wall time.
+
+    CPU time is the calling thread's, or this process's for NATIVE_THREAD_STAGES, so a stage
+    never absorbs work another pipeline stage does at the same time; the CPU of child processes
+    the stage ran (usage from run_process / wait_for_child) is added on top.
+    process_peak_rss_mb is the process-lifetime high-water mark when the stage ended, not the
+    stage's own peak; child_peak_rss_mb is the largest child process the stage ran.
+    """
+    wall_start, thread_start, process_start = started
+    wall = time.perf_counter() - wall_start
+    if record is None:
+        return wall
+    if stage in NATIVE_THREAD_STAGES:
+        cpu = get_process_cpu_seconds() - process_start
+    else:
+        cpu = time.thread_time() - thread_start
+    usage = usage or {}
+    peak = get_process_peak_rss_mb()
+    entry = {
+        'wall_s': round(wall, 3),
+        'cpu_s': None if usage.get('unmeasured') else round(cpu + usage.get('cpu_s', 0.0), 3),
+        'process_peak_rss_mb': round(peak, 1) if peak is not None else None,
+    }
+    if usage.get('children'):
+        entry['child_cpu_s'] = None if usage.get('unmeasured') else round(usage.get('cpu_s', 0.0), 3)
+        entry['child_peak_rss_mb'] = round(usage['peak_rss_mb'], 1) if 'peak_rss_mb' in usage else None
+    if audio_seconds and wall > 0:
+        entry['audio_s_per_s'] = round(audio_seconds / wall, 2)
+    record['stages'][stage] = entry
+    return wall
+
+
+class Telemetry:
+    """Per-video stage records appended to a JSONL file, with a summary table for the run."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.records = []
+
+    def write(self, record):
+        record['finished'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with self.lock:
+            self.records.append(record)
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + '\n')
+            except OSError as e:
+                print(f"Error writing telemetry {self.path}: {e}")
+
+    def print_summary(self):
+        if not self.records:
+            return
+        print(f"\n{'Stage':<12}{'Videos':>8}{'Wall (s)':>12}{'CPU (s)':>12}{'Process peak':>14}"
+              f"{'Child peak':>12}{'Audio s/s':>12}")
+        for stage in TELEMETRY_STAGES:
+            entries = [(record['audio_seconds'], record['stages'][stage]) for record in self.records
+                       if stage in record['stages']]
+            if not entries:
+                continue
+            wall = sum(entry['wall_s'] for _, entry in entries)
+            cpus = [entry['cpu_s'] for _, entry in entries]
+            process_peaks = [entry['process_peak_rss_mb'] for _, entry in entries if entry['process_peak_rss_mb'] is not None]
+            child_peaks = [entry['child_peak_rss_mb'] for _, entry in entries if entry.get('child_peak_rss_mb') is not None]
+            audio = sum(audio_seconds for audio_seconds, entry in entries if 'audio_s_per_s' in entry)
+            cpu_text = f"{sum(cpus):.2f}" if None not in cpus else "n/a"
+            process_peak_text = f"{max(process_peaks):.1f}" if process_peaks else "n/a"
+            child_peak_text = f"{max(child_peaks):.1f}" if child_peaks else "-"
+            speed_text = f"{audio / wall:.2f}" if audio and wall > 0 else "-"
+            print(f"{stage:<12}{len(entries):>8}{wall:>12.2f}{cpu_text:>12}{process_peak_text:>14}"
+                  f"{child_peak_text:>12}{speed_text:>12}")
+        print("Peaks in MB: 'Process peak' is the lifetime high-water mark of the process that ran the stage, "
+              "'Child peak' the largest ffmpeg/ffprobe process it started.")
+        statuses = {}
+        for record in self.records:
+            statuses[record.get('status', 'unknown')] = statuses.get(record.get('status', 'unknown'), 0) + 1
+        print("Videos by status: " + ', '.join(f"{status} {count}" for status, count in sorted(statuses.items())))
+        print(f"Telemetry written to {self.path}")
+
+
+class SubtitleEngine:
+    """Transcribe, chunk and burn word-timed subtitles with one backend loaded per process."""
+
+    def __init__(self, config=None):
+        self.config = config or EngineConfig()
+        if self.config.backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{self.config.backend}', choose from {sorted(BACKENDS)}")
+        self.backend = BACKENDS[self.config.backend](self.config)
+        self.loaded = False
+        self.load_seconds = 0.0
+        self.manifest = JobManifest(self.config.manifest_path) if self.config.manifest_path else None
+        self.telemetry = Telemetry(self.config.telemetry_path) if self.config.telemetry_path else None
+
+    def load(self):
+        """Load the backend model once; later calls are free."""
+        if not self.loaded:
+            start = time.perf_counter()
+            self.backend.load()
+            self.load_seconds = time.perf_counter() - start
+            self.loaded = True
+            print(f"[{os.getpid()}] Loaded {self.backend.name} model '{self.backend.model_name}' "
+                  f"with {self.config.cpu_threads} threads in {self.load_seconds:.2f}s")
+
+    def vad_params(self):
+        config = self.config
+        if not config.vad:
+            return None
+        return [config.vad_frame_seconds, config.vad_threshold_db, config.vad_floor_db,
+                config.vad_min_silence_seconds, config.vad_padding_seconds]
+
+    def cache_params(self, audio_seconds=None):
+        """Everything that changes the transcript, used as the word timing cache key."""
+        params = self.backend.cache_params()
+        params['vad'] = self.vad_params()
+        params['audio_seconds'] = audio_seconds
+        return params
+
+    def render_params(self):
+        """Everything that changes the rendered output apart from the input file and style header."""
+        config = self.config
+        params = self.cache_params()
+        del params['audio_seconds']
+        params.update({
+            'speed_factor': config.speed_factor, 'title_seconds': config.title_seconds,
+            'trim_to_speed_factor': config.trim_to_speed_factor,
+            'guard_seconds': config.guard_seconds if config.trim_to_speed_factor and config.clip_audio else None,
+            'max_chunk_words': config.max_chunk_words, 'min_chunk_duration': config.min_chunk_duration,
+            'preset': config.preset, 'crf': config.crf,
+        })
+        return params
+
+    def ass_header(self):
+        config = self.config
+        return ASS_HEADER.format(font_name=config.font_name, font_size=config.font_size,
+                                 bold=1 if config.bold else 0, italic=1 if config.italic else 0)
+
+    def transcribe_audio(self, audio, record=None, name="audio"):
+        """Transcribe decoded audio (VAD-gated when enabled) and return words and timings."""
+        if not self.loaded:
+            started = start_stage()
+            self.load()
+            end_stage(record, 'model_load', started)
+
+        started = start_stage()
+        speech_audio = audio
+        if self.config.vad:
+            regions = detect_speech_regions(audio, self.config.vad_threshold_db, self.config.vad_min_silence_seconds,
+                                            self.config.vad_frame_seconds, self.config.vad_padding_seconds,
+                                            self.config.vad_floor_db)
+            speech_audio, gated_starts = gate_audio(audio, regions)
+            print(f"Found {len(regions)} speech regions in {name}: "
+                  f"{len(speech_audio) / SAMPLE_RATE:.2f}s of {len(audio) / SAMPLE_RATE:.2f}s")
+        result = self.backend.transcribe(speech_audio) if len(speech_audio) else []
+        words = [word for word, _, _ in result]
+        if self.config.vad:
+            timings = [(remap_time(start, regions, gated_starts), remap_time(end, regions, gated_starts, is_end=True))
+                       for _, start, end in result]
+        else:
+            timings = [(start, end) for _, start, end in result]
+        wall = end_stage(record, 'transcribe', started, len(audio) / SAMPLE_RATE)
+        print(f"Transcribed {name} in {wall:.2f}s ({len(audio) / SAMPLE_RATE:.2f}s of audio)")
+        return words, timings
+
+    def transcribe_file(self, path, record=None):
+        """Decode and transcribe a file; returns (words, timings, duration), using the cache when set."""
+        config = self.config
+        name = os.path.basename(path)
+        audio_seconds = None
+        try:
+            if config.trim_to_speed_factor and config.clip_audio:
+                # Chunks after duration / speed_factor are dropped, so only decode up to that point
+                # plus a guard band for words crossing the cut; this needs the duration up front
+                usage = {}
+                started = start_stage()
+                duration = get_container_duration(path, usage)
+                end_stage(record, 'probe', started, usage=usage)
+                audio_seconds = round(duration / config.speed_factor + config.guard_seconds, 3)
+                usage = {}
+                started = start_stage()
+                audio = decode_audio(path, audio_seconds, usage=usage)
+            else:
+                usage = {}
+                started = start_stage()
+                audio = decode_audio(path, usage=usage)
+                duration = len(audio) / SAMPLE_RATE
+            end_stage(record, 'decode', started, len(audio) / SAMPLE_RATE, usage)
+            if duration == 0:
+                raise ValueError("invalid duration")
+        except Exception as e:
+            if record is not None:
+                record['status'] = 'decode_failed'
+            raise RuntimeError(f"could not decode audio: {e}") from e
+        if record is not None:
+            record['audio_seconds'] = round(len(audio) / SAMPLE_RATE, 3)
+
+        # Reuse cached word timings when the audio and transcription settings are unchanged
+        if config.cache_dir:
+            params = self.cache_params(audio_seconds)
+            key = get_cache_key(audio, params)
+            cached = load_cached_words(config.cache_dir, key)
+            if cached:
+                print(f"Loaded {len(cached[0])} cached word timings for {name}")
+                return cached[0], cached[1], duration
+
+        words, timings = self.transcribe_audio(audio, record, name)
+        if config.cache_dir and words:
+            save_cached_words(config.cache_dir, config.cache_max_mb, key, params, words, timings)
+        return words, timings, duration
+
+    def build_ass(self, title, words, timings, duration, record=None):
+        """Build the ASS document: a title card followed by the word chunks."""
+        config = self.config
+        audio_end = duration / config.speed_factor if config.trim_to_speed_factor else float('inf')
+        started = start_stage()
+        chunks, chunk_timings = build_chunks(words, timings, config.max_chunk_words, config.min_chunk_duration)
+        end_stage(record, 'chunking', started)
+
+        ass_content = self.ass_header()
+        ass_content += (f"Dialogue: 0,0:00:00.00,{format_time(config.title_seconds / config.speed_factor)},"
+                        f"Default,,0,0,0,,{escape_ass_text(title)}\n")
+        for i, (chunk, (start_time, end_time)) in enumerate(zip(chunks, chunk_timings)):
+            if start_time >= audio_end or end_time <= start_time:
+                print(f"Skipping invalid timing for chunk {i}: start={start_time}, end={end_time}")
+                continue
+            end_time = max(end_time, start_time + config.min_chunk_duration)
+            ass_text = escape_ass_text(' '.join(chunk))
+            ass_content += f"Dialogue: 0,{format_time(start_time)},{format_time(end_time)},Default,,0,0,0,,{ass_text}\n"
+            if config.debug:
+                print(f"Chunk {i}: {format_time(start_time)} to {format_time(end_time)}, Text: {ass_text}")
+        return ass_content
+
+    def burn_command(self, video_path, ass_path, output_path, threads=None):
+        """FFmpeg command that burns an ASS file into a video with the configured encoder settings."""
+        config = self.config
+        font_name = config.font_name.replace(' ', '\\ ')
+        return [
+            'ffmpeg', '-v', 'error', '-nostdin', '-i', video_path,
+            '-vf', f"subtitles='{escape_filter_path(ass_path)}':force_style='FontName={font_name},FontSize={config.font_size}':charenc=UTF-8",
+            '-c:v', 'libx264', '-preset', config.preset, '-crf', str(config.crf),
+            '-threads', str(config.encode_threads if threads is None else threads), '-c:a', 'copy', '-y', output_path
+        ]
+
+    def burn_segments_in_parallel(self, video_path, ass_path, output_path, duration, work_dir, usage=None):
+        """Burn subtitles by splitting the video at keyframes, encoding the segments concurrently
+        and joining them with the concat demuxer (no second encode)."""
+        segment_count = self.config.parallel_burn_segments
+        os.makedirs(work_dir, exist_ok=True)
+        segment_list = os.path.join(work_dir, 'segments.csv')
+        split_times = ','.join(f"{duration * i / segment_count:.3f}" for i in range(1, segment_count))
+        run_process([
+            'ffmpeg', '-v', 'error', '-nostdin', '-i', video_path, '-map', '0', '-c', 'copy',
+            '-f', 'segment', '-segment_times', split_times, '-reset_timestamps', '1',
+            '-segment_list', segment_list, '-segment_list_type', 'csv',
+            '-y', os.path.join(work_dir, 'source_%03d.mp4')
+        ], usage)
+
+        # The segment list records where each segment really starts (the keyframe at or after the split time)
+        segments = []
+        with open(segment_list, 'r', encoding='utf-8') as f:
+            for line in f:
+                name, start, end = line.strip().rsplit(',', 2)
+                segments.append((os.path.join(work_dir, name), float(start), float(end)))
+        print(f"Split {os.path.basename(video_path)} into {len(segments)} segments at keyframes")
+
+        threads = max(1, self.config.encode_threads // len(segments))
+        commands = []
+        for i, (source, start, end) in enumerate(segments):
+            segment_ass = os.path.join(work_dir, f"subtitles_{i:03d}.ass")
+            write_segment_ass(ass_path, segment_ass, start, end)
+            commands.append(self.burn_command(source, segment_ass, os.path.join(work_dir, f"burned_{i:03d}.mp4"), threads))
+        with ThreadPoolExecutor(max_workers=len(commands)) as executor:
+            list(executor.map(lambda command: run_process(command, usage), commands))
+
+        concat_list = os.path.join(work_dir, 'concat.txt')
+        with open(concat_list, 'w', encoding='utf-8') as f:
+            for i in range(len(segments)):
+                f.write(f"file 'burned_{i:03d}.mp4'\n")
+        run_process([
+            'ffmpeg', '-v', 'error', '-nostdin', '-f', 'concat', '-safe', '0', '-i', concat_list,
+            '-c', 'copy', '-y', output_path
+        ], usage)
+
+    def check_burn_sync(self, video_file, video_path, output_path):
+        """Check that a parallel burn matches the source duration and A/V offset."""
+        tolerance = self.config.parallel_burn_tolerance
+        try:
+            source_duration, source_streams = probe_durations(video_path)
+            output_duration, output_streams = probe_durations(output_path)
+        except (subprocess.CalledProcessError, json.JSONDecodeError, KeyError, ValueError) as e:
+            print(f"Could not verify parallel burn for {video_file}: {e}")
+            return False
+        duration_drift = abs(output_duration - source_duration)
+        sync_drift = 0.0
+        if all(kind in streams for kind in ('video', 'audio') for streams in (source_streams, output_streams)):
+            sync_drift = abs((output_streams['video'] - output_streams['audio'])
+                             - (source_streams['video'] - source_streams['audio']))
+        if duration_drift > tolerance or sync_drift > tolerance:
+            print(f"Warning: parallel burn of {video_file} drifted (duration {duration_drift:.3f}s, A/V {sync_drift:.3f}s)")
+            return False
+        print(f"Verified parallel burn of {video_file}: duration drift {duration_drift:.3f}s, A/V drift {sync_drift:.3f}s")
+        return True
+
+    def burn(self, video_file, video_path, ass_path, output_path, duration, usage=None):
+        """Burn the ASS subtitles into a video, in parallel segments for long videos; returns True on success.
+
+        A parallel burn that fails the sync check is redone in a single ffmpeg process. The
+        ffmpeg processes' resource usage is added to usage.
+        """
+        config = self.config
+        work_dir = os.path.splitext(ass_path)[0] + '_segments'
+        try:
+            burned = False
+            if config.parallel_burn_segments > 1 and duration >= config.parallel_burn_min_seconds:
+                print(f"Burning {video_file} in {config.parallel_burn_segments} parallel segments")
+                self.burn_segments_in_parallel(video_path, ass_path, output_path, duration, work_dir, usage)
+                burned = not config.verify_parallel_burn or self.check_burn_sync(video_file, video_path, output_path)
+                if not burned:
+                    print(f"Falling back to a single-process burn for {video_file}")
+            if not burned:
+                command = self.burn_command(video_path, ass_path, output_path)
+                print(f"Running FFmpeg command: {' '.join(command)}")
+                run_process(command, usage)
+            print(f"Successfully processed {video_file}")
+            return True
+        except subprocess.CalledProcessError as e:
+            print(f"Error burning subtitles for {video_file}: {e.stderr}")
+        except Exception as e:
+            print(f"Unexpected error running FFmpeg for {video_file}: {e}")
+        finally:
+            if os.path.exists(ass_path):
+                try:
+                    os.remove(ass_path)
+                except OSError as e:
+                    print(f"Error cleaning up ASS file {ass_path}: {e}")
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return False
+
+    def input_state(self, video_path, output_path, entry):
+        """A video's input state for the manifest; the content hash is reused while size and mtime match."""
+        stat = os.stat(video_path)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            file_hash = entry['hash']
+        else:
+            file_hash = get_file_hash(video_path)
+        return {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': file_hash,
+            'params': self.render_params(),
+            'style': hashlib.sha256(self.ass_header().encode()).hexdigest(),
+            'output': output_path,
+        }
+
+    def make_job(self, video_path, output_path, title=None, ass_path=None, input_state=None):
+        """Describe one video for the transcribe and encode stages."""
+        video_file = os.path.basename(video_path)
+        base_name = os.path.splitext(video_file)[0]
+        return {
+            'video_file': video_file,
+            'video_path': video_path,
+            'title': title if title is not None else base_name.replace('_', ' '),
+            'output_path': output_path,
+            'ass_path': ass_path or os.path.join(tempfile.gettempdir(), f"{os.getpid()}_{base_name}.ass"),
+            'input_state': input_state,
+            'duration': None,
+            'telemetry': {'video': video_file, 'audio_seconds': None, 'stages': {}},
+        }
+
+    def transcribe_job(self, job):
+        """Transcription stage for one job; returns (job, words, timings, error)."""
+        started = time.perf_counter()
+        try:
+            words, timings, job['duration'] = self.transcribe_file(job['video_path'], job['telemetry'])
+            error = None
+        except Exception as e:
+            words, timings, error = [], [], str(e)
+            job['telemetry'].setdefault('status', 'transcribe_failed')
+            job['telemetry']['error'] = error
+        job['transcribe_seconds'] = time.perf_counter() - started
+        return job, words, timings, error
+
+    def write_job_ass(self, job, words, timings, error):
+        """Write a transcribed job's ASS file; returns True when it is ready for the encoder.
+
+        Jobs that stop here still get their telemetry line, with the reason as the status.
+        """
+        video_file = job['video_file']
+        record = job['telemetry']
+        if error:
+            print(f"Error transcribing {video_file}: {error}")
+            return self.finish_job(job, False)
+        if not words:
+            print(f"No valid words transcribed for {video_file}, skipping.")
+            record['status'] = 'no_words'
+            return self.finish_job(job, False)
+
+        ass_content = self.build_ass(job['title'], words, timings, job['duration'], record)
+        started = start_stage()
+        try:
+            with open(job['ass_path'], 'w', encoding='utf-8') as f:
+                f.write(ass_content)
+        except OSError as e:
+            print(f"Error writing ASS file for {video_file}: {e}")
+            record['status'] = 'ass_write_failed'
+            record['error'] = str(e)
+            return self.finish_job(job, False)
+        end_stage(record, 'ass_write', started)
+        print(f"Successfully wrote ASS file: {job['ass_path']}")
+        if self.config.debug:
+            print(f"ASS file content:\n{ass_content}")
+        return True
+
+    def encode_job(self, job):
+        """Encoder stage for one job: burn it in, then record telemetry and the manifest entry."""
+        record = job['telemetry']
+        usage = {}
+        started = start_stage()
+        succeeded = self.burn(job['video_file'], job['video_path'], job['ass_path'], job['output_path'],
+                              job['duration'], usage)
+        job['encode_seconds'] = end_stage(record, 'encode', started, record['audio_seconds'], usage)
+        record['status'] = 'ok' if succeeded else 'encode_failed'
+        if succeeded and self.manifest and job['input_state']:
+            self.manifest.record(job['video_file'], job['input_state'])
+        return self.finish_job(job, succeeded)
+
+    def finish_job(self, job, succeeded):
+        """Write a job's telemetry line, whether it finished or stopped early; returns succeeded."""
+        if self.telemetry:
+            self.telemetry.write(job['telemetry'])
+        return succeeded
+
+    def process_video(self, video_path, output_path, title=None, temp_dir=None):
+        """Transcribe a video, write its ASS file and burn it in; returns True on success."""
+        ass_path = None
+        if temp_dir:
+            ass_path = os.path.join(temp_dir, hashlib.md5(os.path.basename(video_path).encode()).hexdigest()[:10] + '.ass')
+        job = self.make_job(video_path, output_path, title, ass_path)
+        if not self.write_job_ass(*self.transcribe_job(job)):
+            return False
+        return self.encode_job(job)
+
+    def collect_jobs(self, video_dir, out_dir, text_dir=None, temp_dir=None):
+        """Jobs for the videos in video_dir that need rendering (only those with a transcript when text_dir is set)."""
+        temp_dir = temp_dir or tempfile.gettempdir()
+        jobs = []
+        for video_file in sorted(os.listdir(video_dir)):
+            if not video_file.lower().endswith(VIDEO_EXTENSIONS):
+                print(f"Skipping non-video file: {video_file}")
+                continue
+            base_name = os.path.splitext(video_file)[0]
+            video_path = os.path.join(video_dir, video_file)
+
+            # Shorten output file name
+            safe_base_name = hashlib.md5(base_name.encode()).hexdigest()[:10]
+            output_path = os.path.join(out_dir, f"{safe_base_name}.mp4")
+
+            # Skip videos whose last render used exactly the same inputs
+            input_state = None
+            if self.manifest:
+                entry = self.manifest.get(video_file)
+                try:
+                    input_state = self.input_state(video_path, output_path, entry)
+                except OSError as e:
+                    print(f"Error reading {video_file}: {e}")
+                    continue
+                if is_up_to_date(entry, input_state):
+                    if entry.get('mtime') != input_state['mtime']:
+                        self.manifest.record(video_file, input_state)
+                    print(f"Skipping unchanged video: {video_file}")
+                    continue
+
+            if text_dir and not os.path.exists(os.path.join(text_dir, base_name + '.txt')):
+                print(f"Text file not found for {video_file}, skipping.")
+                continue
+            jobs.append(self.make_job(video_path, output_path, ass_path=os.path.join(temp_dir, f"{safe_base_name}.ass"),
+                                      input_state=input_state))
+        return jobs
+
+    def transcribe_jobs(self, jobs):
+        """Yield (job, words, timings, error) as jobs finish, from worker processes when configured."""
+        workers = min(self.config.workers, len(jobs))
+        if workers > 1:
+            print(f"Transcribing with {workers} worker processes x {self.config.cpu_threads} threads, "
+                  f"encoding with {self.config.encode_threads} threads")
+            with Pool(workers, initializer=init_transcription_worker, initargs=(self.config,)) as pool:
+                yield from pool.imap_unordered(transcribe_job, jobs)
+        else:
+            for job in jobs:
+                print(f"Processing video: {job['video_file']}")
+                yield self.transcribe_job(job)
+
+    def run_directory(self, video_dir, out_dir, text_dir=None, temp_dir=None):
+        """Burn subtitles into every video in video_dir.
+
+        Transcription (in this process or in worker processes) feeds a bounded queue and a
+        single encoder thread burns the videos, so video N+1 is transcribed while video N
+        is encoded.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        jobs = self.collect_jobs(video_dir, out_dir, text_dir, temp_dir)
+        print(f"Found {len(jobs)} videos to process")
+        if not jobs:
+            return
+
+        encode_queue = queue.Queue(maxsize=self.config.pipeline_queue_size)
+        busy = {'transcribe': 0.0, 'encode': 0.0}
+
+        def encode_worker():
+            while True:
+                job = encode_queue.get()
+                if job is None:
+                    break
+                self.encode_job(job)
+                busy['encode'] += job['encode_seconds']
+
+        pipeline_start = time.perf_counter()
+        encoder = threading.Thread(target=encode_worker, daemon=True)
+        encoder.start()
+        try:
+            for job, words, timings, error in self.transcribe_jobs(jobs):
+                busy['transcribe'] += job['transcribe_seconds']
+                if self.write_job_ass(job, words, timings, error):
+                    encode_queue.put(job)
+        finally:
+            encode_queue.put(None)
+            encoder.join()
+
+        if self.telemetry:
+            self.telemetry.print_summary()
+        wall_time = time.perf_counter() - pipeline_start
+        workers = max(1, min(self.config.workers, len(jobs)))
+        if wall_time > 0:
+            print(f"Pipeline finished in {wall_time:.2f}s: transcribe stage busy {busy['transcribe']:.2f}s "
+                  f"({busy['transcribe'] / (wall_time * workers):.0%} of {workers} worker(s)), "
+                  f"encode stage busy {busy['encode']:.2f}s ({busy['encode'] / wall_time:.0%})")
+
+
+# Per-process engine for transcription workers, created by init_transcription_worker; the
+# model itself is only loaded when the first uncached video arrives
+_worker_engine = None
+
+
+def cap_workers(workers, encode_threads):
+    """Limit transcription processes to the cores left once the encoder's threads are reserved
+    (at least one), so each worker can get a core of its own."""
+    available = max(1, (os.cpu_count() or 4) - encode_threads)
+    if workers > available:
+        print(f"Reducing transcription workers from {workers} to {available}: only {available} core(s) "
+              f"left after {encode_threads} encoder thread(s)")
+        return available
+    return max(1, workers)
+
+
+def worker_thread_budget(workers, encode_threads):
+    """Model threads per transcription process once the encoder's threads are reserved.
+
+    With workers capped by cap_workers, workers x threads + encode_threads stays within the core
+    count, unless encode_threads alone already uses every core (each worker still gets one thread).
+    """
+    return max(1, ((os.cpu_count() or 4) - encode_threads) // max(1, workers))
+
+
+def init_transcription_worker(config):
+    """Set up a transcription worker process."""
+    global _worker_engine
+    _worker_engine = SubtitleEngine(replace(config, manifest_path=None, telemetry_path=None))
+
+
+def transcribe_job(job):
+    """Transcribe one job in a worker process."""
+    return _worker_engine.transcribe_job(job)
+
+
+def run_script(config, video_dir, text_dir, out_dir, temp_dir, description="Generate and burn word-timed subtitles."):
+    """Entry point for the standalone scripts: cache maintenance flags, then a full directory run."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--cache-info', action='store_true', help="List word timing cache entries and exit")
+    parser.add_argument('--cache-prune', type=float, metavar='MB',
+                        help="Evict least recently used cache entries until the cache is under MB and exit")
+    args = parser.parse_args()
+    if args.cache_info or args.cache_prune is not None:
+        if not config.cache_dir:
+            print("No word timing cache is configured.")
+            return
+        if args.cache_prune is not None:
+            print(f"Removed {prune_cache(config.cache_dir, args.cache_prune)} cache entries")
+        print_cache_info(config.cache_dir, config.cache_max_mb)
+        return
+
+    # Validate directories
+    for directory in [video_dir, text_dir, out_dir, temp_dir]:
+        os.makedirs(directory, exist_ok=True)
+        if not os.path.isdir(directory):
+            print(f"Error: {directory} is not a directory.")
+            sys.exit(1)
+
+    # Check FFmpeg installation
+    try:
+        subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True, check=True)
+        subprocess.run(['ffprobe', '-version'], capture_output=True, text=True, check=True)
+    except FileNotFoundError:
+        print("Error: FFmpeg or ffprobe not found. Please ensure FFmpeg is installed and added to PATH.")
+        sys.exit(1)
+
+    SubtitleEngine(config).run_directory(video_dir, out_dir, text_dir, temp_dir)
+
+
+def normalize_word(word):
+    """Lower-case a word and strip punctuation for timing comparisons."""
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def compare_word_timings(reference, words, timings):
+    """Match hypothesis words to reference words; returns (matched fraction, start errors, end errors)."""
+    reference_words = [normalize_word(item['word']) for item in reference]
+    hypothesis_words = [normalize_word(word) for word in words]
+    matcher = difflib.SequenceMatcher(None, reference_words, hypothesis_words, autojunk=False)
+    start_errors = []
+    end_errors = []
+    for block in matcher.get_matching_blocks():
+        for offset in range(block.size):
+            expected = reference[block.a + offset]
+            start, end = timings[block.b + offset]
+            start_errors.append(abs(start - expected['start']))
+            end_errors.append(abs(end - expected['end']))
+    matched = len(start_errors) / len(reference) if reference else 0.0
+    return matched, start_errors, end_errors
+
+
+def run_benchmark(config, backend_names, fixtures_dir):
+    """Compare backends on speed and word-timing accuracy against local fixture clips.
+
+    Each fixture is an audio or video file with a JSON file of the same base name holding
+    the reference timings: [{"word": "...", "start": 0.0, "end": 0.4}, ...].
+    """
+    fixtures = []
+    for name in sorted(os.listdir(fixtures_dir)):
+        base_name, extension = os.path.splitext(name)
+        reference_path = os.path.join(fixtures_dir, base_name + '.json')
+        if extension.lower() in FIXTURE_EXTENSIONS and os.path.exists(reference_path):
+            with open(reference_path, 'r', encoding='utf-8') as f:
+                fixtures.append((name, decode_audio(os.path.join(fixtures_dir, name)), json.load(f)))
+    if not fixtures:
+        print(f"No fixtures (media file + reference .json) found in {fixtures_dir}")
+        return
+
+    rows = []
+    for backend_name in backend_names:
+        engine = SubtitleEngine(replace(config, backend=backend_name, cache_dir=None, manifest_path=None,
+                                        telemetry_path=None))
+        engine.load()
+        audio_seconds = 0.0
+        transcribe_seconds = 0.0
+        matched_total = 0.0
+        start_errors = []
+        end_errors = []
+        for name, audio, reference in fixtures:
+            start = time.perf_counter()
+            words, timings = engine.transcribe_audio(audio, name=name)
+            elapsed = time.perf_counter() - start
+            matched, starts, ends = compare_word_timings(reference, words, timings)
+            print(f"{backend_name:<20} {name}: {elapsed:.2f}s, {matched:.0%} words matched")
+            audio_seconds += len(audio) / SAMPLE_RATE
+            transcribe_seconds += elapsed
+            matched_total += matched
+            start_errors += starts
+            end_errors += ends
+        rows.append((f"{backend_name} ({engine.backend.model_name})", engine.load_seconds, audio_seconds,
+                     transcribe_seconds, matched_total / len(fixtures),
+                     1000 * float(np.mean(start_errors)) if start_errors else float('nan'),
+                     1000 * float(np.mean(end_errors)) if end_errors else float('nan')))
+
+    print(f"\n{'Backend':<32}{'Load (s)':>10}{'Audio (s)':>11}{'Time (s)':>10}{'x RT':>8}"
+          f"{'Matched':>9}{'Start err (ms)':>16}{'End err (ms)':>14}")
+    for label, load_seconds, audio_seconds, transcribe_seconds, matched, start_error, end_error in rows:
+        speed = audio_seconds / transcribe_seconds if transcribe_seconds > 0 else float('nan')
+        print(f"{label:<32}{load_seconds:>10.2f}{audio_seconds:>11.1f}{transcribe_seconds:>10.2f}{speed:>8.1f}"
+              f"{matched:>9.0%}{start_error:>16.0f}{end_error:>14.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Word-timed subtitle engine with pluggable Whisper backends.")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default="faster-whisper")
+    parser.add_argument('--model', help="Model name (default: small for faster-whisper, tiny for whisper_timestamped)")
+    parser.add_argument('--compute-type', default="int8", help="faster-whisper compute type")
+    parser.add_argument('--beam-size', type=int, default=5)
+    parser.add_argument('--cpu-threads', type=int,
+                        help="Model threads per transcribing process (default: the cores left after the "
+                             "encoder's threads, split between the workers)")
+    parser.add_argument('--no-vad', action='store_true', help="Transcribe silence as well")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Transcribe and burn subtitles for a folder of videos")
+    run_parser.add_argument('video_dir')
+    run_parser.add_argument('out_dir')
+    run_parser.add_argument('--text-dir', help="Only process videos with a matching .txt transcript here")
+    run_parser.add_argument('--temp-dir')
+    run_parser.add_argument('--workers', type=int, default=1, help="Transcription worker processes")
+    run_parser.add_argument('--cache-dir', help="Word timing cache directory")
+    run_parser.add_argument('--incremental', action='store_true', help="Skip videos unchanged since their last render")
+    run_parser.add_argument('--telemetry', action='store_true', help="Write OUT_DIR/telemetry.jsonl and a summary table")
+    run_parser.add_argument('--debug', action='store_true', help="Print every subtitle chunk and the full ASS file")
+    run_parser.add_argument('--speed-factor', type=float, default=4)
+    run_parser.add_argument('--title-seconds', type=float, default=1)
+    run_parser.add_argument('--trim-to-speed-factor', action='store_true',
+                            help="Only transcribe and subtitle the first duration / speed_factor seconds")
+    run_parser.add_argument('--font-name', default="Seagl Print")
+    run_parser.add_argument('--font-size', type=int, default=70)
+    run_parser.add_argument('--italic', action='store_true', help="Italic captions (they are bold either way)")
+    run_parser.add_argument('--preset', default="fast")
+    run_parser.add_argument('--crf', type=int, default=23)
+    run_parser.add_argument('--encode-threads', type=int, default=EngineConfig.encode_threads)
+    run_parser.add_argument('--parallel-burn-segments', type=int, default=1,
+                            help="Burn long videos as this many keyframe-split segments in parallel")
+
+    bench_parser = subparsers.add_parser('bench', help="Compare backends on fixture clips with reference timings")
+    bench_parser.add_argument('fixtures_dir')
+    bench_parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), default=sorted(BACKENDS))
+
+    cache_parser = subparsers.add_parser('cache', help="Inspect or prune a word timing cache")
+    cache_parser.add_argument('cache_dir')
+    cache_parser.add_argument('--prune', type=float, metavar='MB',
+                              help="Evict least recently used entries until the cache is under MB")
+    args = parser.parse_args()
+
+    if args.command == 'cache':
+        if args.prune is not None:
+            print(f"Removed {prune_cache(args.cache_dir, args.prune)} cache entries")
+        print_cache_info(args.cache_dir, EngineConfig.cache_max_mb)
+        return
+
+    config = EngineConfig(backend=args.backend, model=args.model, compute_type=args.compute_type,
+                          beam_size=args.beam_size, cpu_threads=args.cpu_threads or EngineConfig.cpu_threads,
+                          vad=not args.no_vad)
+    if args.command == 'bench':
+        run_benchmark(config, args.backends, args.fixtures_dir)
+        return
+
+    workers = args.workers if args.cpu_threads else cap_workers(args.workers, args.encode_threads)
+    cpu_threads = args.cpu_threads or worker_thread_budget(workers, args.encode_threads)
+    config = replace(config, cpu_threads=cpu_threads, workers=workers, cache_dir=args.cache_dir, speed_factor=args.speed_factor,
+                     title_seconds=args.title_seconds, trim_to_speed_factor=args.trim_to_speed_factor,
+                     font_name=args.font_name, font_size=args.font_size, italic=args.italic, preset=args.preset, crf=args.crf,
+                     encode_threads=args.encode_threads, parallel_burn_segments=args.parallel_burn_segments,
+                     manifest_path=os.path.join(args.out_dir, "manifest.json") if args.incremental else None,
+                     telemetry_path=os.path.join(args.out_dir, "telemetry.jsonl") if args.telemetry else None,
+                     debug=args.debug)
+    SubtitleEngine(config).run_directory(args.video_dir, args.out_dir, args.text_dir, args.temp_dir)
+
+
+if __name__ == "__main__":
+    main()